@@ -2,18 +2,33 @@
 # -*- coding: utf-8 -*-
 import json
 import sys
+import argparse
 import urllib.request
 import urllib.error
 import urllib.parse
+import http.client
+import socket
 import subprocess
 import textwrap
 import os
 import re
-from typing import List, Dict, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
+from dataclasses import dataclass, asdict, replace, field
 from datetime import datetime
 import time
+import threading
+import queue
+import uuid
+from contextlib import contextmanager, nullcontext
+import hashlib
+import html
+import zlib
+import struct
+import bisect
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 # Rich imports for UI
 from rich.console import Console
 from rich.panel import Panel
@@ -22,13 +37,30 @@ from rich.table import Table
 from rich.markdown import Markdown
 from rich.live import Live
 from rich.spinner import Spinner
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
 from rich.layout import Layout
 from rich.text import Text
+from rich.markup import escape
 from rich.syntax import Syntax
 from rich.columns import Columns
+# Optional: semantic memory needs numpy
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # Initialize Rich console
 console = Console()
+
+
+def env_int(name: str, default: int, minimum: int = 1) -> int:
+    """Integer from an environment variable; blank or invalid values fall back to default"""
+    try:
+        value = int(os.environ.get(name, "").strip())
+    except ValueError:
+        return default
+    return max(minimum, value)
+
+
 CONFIG = {
     "OLLAMA_URL": "http://127.0.0.1:11434",
     "REQUEST_TIMEOUT": 120,
@@ -36,8 +68,92 @@ CONFIG = {
     "MAX_HISTORY_TURNS": 10,
     "SAVE_DIR": "adventure_saves",
     "EXPORT_DIR": "adventure_exports",
+    # Model tiering: routine actions go to FAST_MODEL, dramatic scenes to the main model
+    "FAST_MODEL": None,
+    "FULL_TIER_ACTION_TYPES": ["combat", "social"],
+    "FULL_TIER_INTENSITIES": ["high"],
+    "FULL_TIER_PROMPT_CHARS": 6000,
+    # Adaptive generation options learned from observed response lengths
+    "ADAPTIVE_GENERATION": True,
+    "ADAPTIVE_SAFETY_MARGIN": 0.25,
+    "ADAPTIVE_WINDOW": 20,
+    "ADAPTIVE_MIN_SAMPLES": 3,
+    "NUM_PREDICT_MIN": 48,
+    "NUM_PREDICT_MAX": 250,
+    "NUM_CTX_MIN": 2048,
+    "NUM_CTX_MAX": 8192,
+    "SHOW_GENERATION_STATS": False,
+    # Response cache, only used when a fixed SEED makes generations reproducible
+    "SEED": None,
+    "RESPONSE_CACHE_SIZE": 256,
+    "RESPONSE_CACHE_DISK": True,
+    "CACHE_DIR": "adventure_cache",
+    # Live rendering of streamed responses
+    "STREAM_RESPONSES": True,
+    "STREAM_REFRESH_PER_SECOND": 12,
+    # Saves: "dgsave" (compressed, paged history) or "json"
+    "SAVE_FORMAT": "dgsave",
+    "SAVE_BLOCK_SIZE": 64,
+    "SAVE_COMPRESSION_LEVEL": 6,
+    # Structured world state carried in the prompt instead of long transcripts
+    "USE_WORLD_STATE": True,
+    "WORLD_STATE_HISTORY_MESSAGES": 4,
+    "WORLD_STATE_MAX_CHARS": 1200,
+    "WORLD_STATE_MODEL_PASS": False,
+    # Semantic memory: embed turns and retrieve relevant older ones (needs numpy)
+    "SEMANTIC_MEMORY": False,
+    "EMBEDDING_MODEL": "nomic-embed-text",
+    "EMBEDDING_BATCH_SIZE": 16,
+    "EMBEDDING_CACHE_SIZE": 4096,
+    "MEMORY_TOP_K": 3,
+    "MEMORY_MIN_SCORE": 0.3,
+    # Client-side scheduling of requests to the (shared) Ollama host
+    "MAX_PARALLEL_GENERATIONS": env_int("OLLAMA_NUM_PARALLEL", 4),
+    "SCHEDULER_BACKGROUND_SLOTS": 1,
+    "SCHEDULER_MAX_QUEUE_PER_SESSION": 4,
+    "SCHEDULER_MAX_BACKGROUND_QUEUE": 32,
+    # Response post-processing, applied in this order
+    "POSTPROCESS_STEPS": ["stop_tokens", "filler", "sentence_limit", "passive_voice", "consequence_first"],
+    "MAX_RESPONSE_SENTENCES": 4,
+    # Instruction set sent every turn: "full" or "compact" (deduplicated, fewer prompt tokens)
+    "PROMPT_VARIANT": "full",
+    # Multi-session processes: idle sessions are flushed to SESSION_DIR and reloaded on demand
+    "SESSION_MEMORY_BUDGET_MB": 256,
+    "SESSION_IDLE_SECONDS": 1800,
+    "SESSION_DIR": "adventure_sessions",
+    # Per-turn latency budget in seconds (0 or None: off, wait up to REQUEST_TIMEOUT). When
+    # it runs out, the streamed text so far is shown, cut at a sentence boundary. Off by
+    # default: a cold load of a large model can take longer than any sensible budget
+    "TURN_DEADLINE": 0,
+    "DEADLINE_FIRST_TOKEN_SHARE": 0.5,
+    # Party mode: one generation per round for the whole party
+    "PARTY_MAX_PLAYERS": 6,
+    "PARTY_TOKENS_PER_PLAYER": 80,
+    # Pre-narrated opening scenes, generated in the background for the most started
+    # (genre, role, model) combinations; 0 disables the pool
+    "OPENING_POOL_SIZE": 2,
+    "OPENING_POOL_COMBOS": 8,
+    "OPENING_POOL_MAX_AGE": 7 * 24 * 3600,
+    # Suggested next actions, generated in the background after each response; 0 disables them
+    "SUGGESTION_COUNT": 3,
+    # Worker threads running post-turn event handlers (autosave, stats, ...)
+    "EVENT_WORKERS": 2,
+    "AUTOSAVE_EVERY": 5,  # actions between autosaves (0: off)
 }
 STOP_TOKENS = ["\n", "Player:", "Dungeon Master:", "System:", "\n---"]
+# Party rounds answer with one line per player, so a newline cannot end the response
+PARTY_STOP_TOKENS = ["Player:", "Dungeon Master:", "System:", "\n---", "ACTIONS THIS ROUND"]
+SUGGESTION_STOP_TOKENS = ["\n\n\n", "Player:", "Dungeon Master:", "System:", "\n---"]
+GENERATION_OPTIONS = {
+    "temperature": 0.8,
+    "stop": STOP_TOKENS,
+    "num_ctx": 4096,
+    "top_p": 0.9,
+    "num_predict": 250,
+    "frequency_penalty": 0.5,
+    "presence_penalty": 0.5,
+}
+CHARS_PER_TOKEN = 4
 ROLE_STARTERS = {
     "Fantasy": {
         "Peasant": "You're working in the fields of a small village when",
@@ -237,6 +353,447 @@ ANALYZE THE PLAYER'S ACTION CAREFULLY:
 - Does this action succeed, fail, or partially succeed based on context?
 RESPOND ONLY with narrative consequences. No commentary, no questions, no setup.
 """
+COMPACT_SYSTEM_PROMPT = """
+You are a Dungeon Master narrating the IMMEDIATE consequences of the player's EXACT action.
+RULES:
+1. 2-4 sentences, each a direct physical or logical result of this specific action (it may succeed, fail or partly succeed).
+2. Start with the direct result, in active voice ("The door splinters", not "The door is splintered").
+3. Only what happens right after the action: no setup, no unrelated events or characters, no questions, no commentary.
+4. Respect the genre's physics and magic.
+EXAMPLE: "Your shoulder slams into the wooden door with a loud crack. The door splinters but holds, rattling in its frame. From inside comes frantic shuffling and a muffled curse."
+"""
+PROMPT_VARIANTS = ("full", "compact")
+OPENING_SCENE_PROMPT = """SYSTEM INSTRUCTIONS:
+{system}
+CONTEXT:
+- Genre: {genre}
+- Setting: {setting}
+- Character role: {role}
+
+Narrate the opening scene of a new adventure in 3-4 sentences, in second person, continuing from:
+"{opener}..."
+End on a concrete situation that calls for the player's first action.
+OPENING SCENE:
+"""
+PARTY_ROUND_RULES = """
+PARTY ROUND RULES:
+1. All actions below happen at the same moment in one shared scene: resolve them together and consistently.
+2. Write one line per acting player, starting with the player's name and a colon (e.g. "Aria: ...").
+3. 1-2 sentences per player, starting with the direct consequence of THEIR action, in active voice.
+"""
+PARTY_STOP_PATTERN = re.compile("|".join(re.escape(token) for token in PARTY_STOP_TOKENS))
+PARTY_LINE_PATTERN = re.compile(r"^[*_]*([^:*_\n]{1,40}?)[*_]*\s*:[*_]*\s*(.*)$")
+SUGGESTION_PROMPT = """
+LAST ACTION: {action}
+RESULT: {response}
+
+Suggest {count} different things the player could do next, one per line.
+Each must start with "I ", be specific and name a person, object or place from the scene above.
+No numbering, no commentary.
+SUGGESTED ACTIONS:
+"""
+# Optional list marker, then the action; quotes are dropped only when one pair wraps the whole line
+SUGGESTION_LINE_PATTERN = re.compile(r"^\s*(?:\d+[.):]|[-*•])?\s*(?:([\"'])((?:(?!\1).)+)\1|(.+?))\s*$")
+WORLD_STATE_PROMPT = """
+Update the world state after the latest exchange. Reply with JSON only:
+{"location": "...", "inventory": ["..."], "npcs": {"name": "attitude"}, "threats": ["..."]}
+Keep entries short. Drop items the player no longer has, NPCs who left and threats that are resolved.
+"""
+WORLD_MOVE_PATTERN = re.compile(r"\b(?:go|walk|run|head|move|enter|climb|sneak|creep|crawl|step|ride|drive|fly)\w*\s+(?:(?:to|into|toward|towards|through|inside|up|down|across)\s+)?(?:the\s+|a\s+|an\s+)?([a-z][a-z' -]{2,40}?)(?=[.,;!?]|\s+(?:and|with|to|while|quietly|slowly|quickly)\b|$)")
+WORLD_ARRIVE_PATTERN = re.compile(r"\b[Yy]ou (?:arrive|emerge|step|stand|find yourself|enter)\s+(?:at|in|inside|into|on)\s+(?:the\s+|a\s+|an\s+)?([A-Za-z][A-Za-z' -]{2,40}?)(?=[.,;!?]|\s+(?:and|where|as)\b)")
+WORLD_TAKE_PATTERN = re.compile(r"\b(?:take|grab|pick up|steal|pocket|loot|collect)\s+(?:the\s+|a\s+|an\s+|my\s+|his\s+|her\s+)?([a-z][a-z' -]{2,30}?)(?=[.,;!?]|\s+(?:and|from|off|with)\b|$)")
+WORLD_DROP_PATTERN = re.compile(r"\b(?:drop|throw|give|hand over|sell|discard|toss)\s+(?:away\s+)?(?:the\s+|a\s+|an\s+|my\s+)?([a-z][a-z' -]{2,30}?)(?=[.,;!?]|\s+(?:and|to|at|into|on)\b|$)")
+WORLD_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WORLD_NPC_PATTERN = re.compile(r"\b(?:[Tt]he|[Aa]n?)\s+((?:old|young|bearded|wounded|hooded|masked|armed|drunk)?\s*(?:guard|merchant|orc|goblin|troll|soldier|officer|captain|sergeant|king|queen|priest|thief|hermit|innkeeper|bartender|stranger|man|woman|child|knight|wizard|dragon|bandit|detective|gangster|android|robot|alien|mutant|raider|senator|noble|peasant|doctor|nurse|spy|beast|wolf|creature|cop|agent))\b")
+WORLD_NAMED_NPC_PATTERN = re.compile(r"\b([A-Z][a-z]{2,})\s+(?:says|said|shouts|whispers|growls|smiles|nods|laughs|snarls|frowns|attacks|draws|flees)\b")
+WORLD_ATTITUDE_PATTERNS = [
+    ("dead", re.compile(r"\b(?:dies|died|dead|lifeless|slain|crumples|collapses)\b", re.IGNORECASE)),
+    ("fled", re.compile(r"\b(?:flees|fled|runs away|retreats|escapes|vanishes)\b", re.IGNORECASE)),
+    ("hostile", re.compile(r"\b(?:attacks|snarls|roars|growls|draws|charges|lunges|aims|threatens|swings|strikes)\b", re.IGNORECASE)),
+    ("afraid", re.compile(r"\b(?:cowers|trembles|flinches|backs away|pleads|whimpers)\b", re.IGNORECASE)),
+    ("friendly", re.compile(r"\b(?:smiles|nods|thanks|laughs|grins|agrees|welcomes|bows)\b", re.IGNORECASE)),
+]
+WORLD_THREAT_PATTERN = re.compile(r"\b(fire|flames|smoke|trap|alarm|poison|gas|collapse|ambush|explosion|gunfire|flood|storm|patrol|reinforcements)\b", re.IGNORECASE)
+# A threat is cleared only by a clearing verb right before or after its name ({threat} is re.escape'd)
+WORLD_THREAT_CLEARED_TEMPLATE = (
+    r"\b(?:extinguish\w*|disarm\w*|douse[sd]?|put(?:s|ting)? out|silenc\w*|defeat\w*|kill(?:s|ed)?|escape[sd]?)\s+(?:the\s+|an?\s+)?{threat}\b"
+    r"|\b{threat}\s+(?:(?:has|have|had|is|was|finally|slowly)\s+)*(?:extinguished|disarmed|silenced|defeated|"
+    r"d(?:ies|ied|ie) (?:down|out)|subside[sd]?|clear(?:s|ed)? away|(?:is|was) over|ends|ended|passe[sd])\b"
+)
+
+
+class GameMetrics:
+    """Thread-safe counters and timings collected while the game runs"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+    
+    def increment(self, name: str, amount: int = 1):
+        """Increase a named counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def set_gauge(self, name: str, value: float):
+        """Set a point-in-time value (queue depth, resident sessions, ...)"""
+        with self._lock:
+            self.gauges[name] = value
+    
+    def record_time(self, name: str, seconds: float):
+        """Record one duration sample (count, total and max are kept)"""
+        with self._lock:
+            timing = self.timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+    
+    def get_counter(self, name: str) -> int:
+        """Get the current value of a counter"""
+        with self._lock:
+            return self.counters.get(name, 0)
+    
+    def get_timing(self, name: str) -> Dict[str, float]:
+        """Get count/total/avg/max for a timing"""
+        with self._lock:
+            timing = dict(self.timings.get(name, {"count": 0, "total": 0.0, "max": 0.0}))
+        timing["avg"] = timing["total"] / timing["count"] if timing["count"] else 0.0
+        return timing
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of all counters and timings"""
+        with self._lock:
+            names = list(self.timings)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "timings": {name: self.get_timing(name) for name in names},
+        }
+
+
+metrics = GameMetrics()
+
+
+class LazyBlock:
+    """A compressed block of messages inside the body of a save file, read into memory"""
+    __slots__ = ("buffer", "offset", "length", "count")
+    
+    def __init__(self, buffer: Any, offset: int, length: int, count: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+        self.count = count
+    
+    def raw(self) -> bytes:
+        """Compressed bytes, as stored in the file"""
+        return bytes(self.buffer[self.offset:self.offset + self.length])
+    
+    def load(self) -> Tuple[Dict[str, str], ...]:
+        """Decompress the block"""
+        metrics.increment("history.pages_loaded")
+        return tuple(json.loads(zlib.decompress(self.buffer[self.offset:self.offset + self.length])))
+
+
+class PagedHistory:
+    """
+    List-like message history made of sealed blocks plus a mutable tail
+    Blocks read from a save stay compressed until a message in them is needed.
+    snapshot() returns a read-only view in O(block_size): sealed blocks are
+    immutable and shared, and the block lists are copied on the next write
+    """
+    PAGE_CACHE_SIZE = 4
+    
+    def __init__(self, messages: Optional[List[Dict[str, str]]] = None, block_size: Optional[int] = None):
+        self.block_size = block_size or CONFIG["SAVE_BLOCK_SIZE"]
+        self._blocks: List[Any] = []  # tuple of messages or LazyBlock
+        self._starts: List[int] = []  # index of each block's first message
+        self._sealed_count = 0
+        self._tail: List[Dict[str, str]] = []
+        self._page_cache: "OrderedDict[int, Tuple[Dict[str, str], ...]]" = OrderedDict()
+        self._shared = False  # block lists are referenced by a snapshot
+        self._read_only = False
+        for message in messages or []:
+            self.append(message)
+    
+    def _own_blocks(self):
+        """Copy-on-write: stop sharing the block lists before changing them"""
+        if self._shared:
+            self._blocks = list(self._blocks)
+            self._starts = list(self._starts)
+            self._shared = False
+    
+    def _check_writable(self):
+        if self._read_only:
+            raise TypeError("history snapshots are read-only")
+    
+    def _add_block(self, block: Any, count: int):
+        self._own_blocks()
+        self._starts.append(self._sealed_count)
+        self._blocks.append(block)
+        self._sealed_count += count
+    
+    def _block_messages(self, block_index: int) -> Tuple[Dict[str, str], ...]:
+        """Messages of a sealed block, paging it in if necessary"""
+        block = self._blocks[block_index]
+        if isinstance(block, tuple):
+            return block
+        cached = self._page_cache.get(block_index)
+        if cached is None:
+            cached = block.load()
+            self._page_cache[block_index] = cached
+            while len(self._page_cache) > self.PAGE_CACHE_SIZE:
+                self._page_cache.popitem(last=False)
+        else:
+            self._page_cache.move_to_end(block_index)
+        return cached
+    
+    def __len__(self) -> int:
+        return self._sealed_count + len(self._tail)
+    
+    def __bool__(self) -> bool:
+        return len(self) > 0
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        if index >= self._sealed_count:
+            return self._tail[index - self._sealed_count]
+        block_index = bisect.bisect_right(self._starts, index) - 1
+        return self._block_messages(block_index)[index - self._starts[block_index]]
+    
+    def __setitem__(self, index: int, message: Dict[str, str]):
+        self._check_writable()
+        if index < 0:
+            index += len(self)
+        if index < self._sealed_count:
+            raise IndexError("only the most recent messages can be replaced")
+        self._tail[index - self._sealed_count] = message
+    
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        # Paged-in blocks are not kept, so a full pass uses constant memory
+        for block in self._blocks:
+            yield from (block if isinstance(block, tuple) else block.load())
+        yield from list(self._tail)
+    
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+    
+    def __repr__(self) -> str:
+        return f"PagedHistory({len(self)} messages, {len(self._blocks)} sealed blocks)"
+    
+    def append(self, message: Dict[str, str]):
+        """Add a message; full blocks of old messages are sealed"""
+        self._check_writable()
+        self._tail.append(message)
+        if len(self._tail) >= 2 * self.block_size:
+            self._add_block(tuple(self._tail[:self.block_size]), self.block_size)
+            del self._tail[:self.block_size]
+    
+    def pop(self) -> Dict[str, str]:
+        """Remove and return the last message"""
+        self._check_writable()
+        if not self._tail:
+            if not self._blocks:
+                raise IndexError("pop from empty history")
+            # Unseal the most recent block (into new lists: snapshots may share the old ones)
+            block_index = len(self._blocks) - 1
+            self._tail = list(self._block_messages(block_index))
+            self._page_cache.pop(block_index, None)
+            self._sealed_count = self._starts[-1]
+            self._blocks = self._blocks[:-1]
+            self._starts = self._starts[:-1]
+            self._shared = False
+        return self._tail.pop()
+    
+    def snapshot(self) -> "PagedHistory":
+        """Read-only view of the current messages; later writes to this history do not affect it"""
+        view = PagedHistory(block_size=self.block_size)
+        view._blocks = self._blocks
+        view._starts = self._starts
+        view._sealed_count = self._sealed_count
+        view._tail = list(self._tail)
+        view._shared = True
+        view._read_only = True
+        self._shared = True
+        return view
+    
+    def iter_blocks(self) -> Iterator[Tuple[Optional[bytes], Optional[List[Dict[str, str]]], int]]:
+        """Yield (compressed_bytes, None, count) for untouched blocks and (None, messages, count) otherwise"""
+        for block in self._blocks:
+            if isinstance(block, LazyBlock):
+                yield block.raw(), None, block.count
+            else:
+                yield None, list(block), len(block)
+        for i in range(0, len(self._tail), self.block_size):
+            chunk = self._tail[i:i + self.block_size]
+            yield None, chunk, len(chunk)
+    
+    def compressed_bytes(self) -> int:
+        """Bytes of blocks held still compressed, as read from a save"""
+        return sum(block.length for block in self._blocks if isinstance(block, LazyBlock))
+    
+    def resident_messages(self) -> Iterator[Dict[str, str]]:
+        """Messages currently held in memory (unsealed, paged-in or never written)"""
+        for block in self._blocks:
+            if isinstance(block, tuple):
+                yield from block
+        for block in self._page_cache.values():
+            yield from block
+        yield from self._tail
+    
+    @classmethod
+    def from_blocks(cls, buffer: Any, index: List[Dict[str, int]], block_size: int) -> "PagedHistory":
+        """History over a save's block index; only the most recent block is decompressed now"""
+        history = cls(block_size=block_size)
+        for entry in index[:-1]:
+            history._add_block(LazyBlock(buffer, entry["offset"], entry["length"], entry["count"]), entry["count"])
+        if index:
+            last = index[-1]
+            history._tail = list(LazyBlock(buffer, last["offset"], last["length"], last["count"]).load())
+        return history
+
+
+@dataclass
+class WorldState:
+    """Compact record of the world, updated every turn so prompts need less raw history"""
+    location: str = ""
+    inventory: List[str] = field(default_factory=list)
+    npcs: Dict[str, str] = field(default_factory=dict)  # name -> attitude
+    threats: List[str] = field(default_factory=list)
+    turn: int = 0
+    
+    MAX_INVENTORY = 12
+    MAX_NPCS = 8
+    MAX_THREATS = 5
+    
+    def is_empty(self) -> bool:
+        """True until something has been extracted"""
+        return not (self.location or self.inventory or self.npcs or self.threats)
+    
+    def update(self, analysis: Dict[str, Any], action: str, response: str):
+        """Cheap local extraction from the player action and the world response"""
+        self.turn += 1
+        threats_before = set(self.threats)
+        action_lower = action.lower()
+        if match := WORLD_MOVE_PATTERN.search(action_lower):
+            self.location = match.group(1)
+        if match := WORLD_ARRIVE_PATTERN.search(response):
+            self.location = match.group(1).lower()
+        # Inventory from action verbs/objects
+        if match := WORLD_TAKE_PATTERN.search(action_lower):
+            self._add(self.inventory, match.group(1), self.MAX_INVENTORY)
+        elif any(verb in analysis["verbs"] for verb in ("take", "grab", "steal", "pick")):
+            for obj in analysis["objects"]:
+                self._add(self.inventory, obj, self.MAX_INVENTORY)
+        if match := WORLD_DROP_PATTERN.search(action_lower):
+            self._remove_matching(self.inventory, match.group(1))
+        if analysis["type"] == "consumption":
+            for obj in analysis["objects"]:
+                self._remove_matching(self.inventory, obj)
+        # NPCs and their attitudes
+        for sentence in WORLD_SENTENCE_PATTERN.split(response):
+            names = [m.group(1).lower() for m in WORLD_NPC_PATTERN.finditer(sentence)]
+            names += [m.group(1) for m in WORLD_NAMED_NPC_PATTERN.finditer(sentence)]
+            if not names:
+                continue
+            attitude = None
+            for candidate, pattern in WORLD_ATTITUDE_PATTERNS:
+                if pattern.search(sentence):
+                    attitude = candidate
+                    break
+            for name in names:
+                if attitude is None and name in self.npcs:
+                    continue
+                self.npcs.pop(name, None)
+                self.npcs[name] = attitude or "neutral"
+                if attitude == "hostile":
+                    self._add(self.threats, name, self.MAX_THREATS)
+                elif attitude in ("dead", "fled", "friendly"):
+                    self._remove_matching(self.threats, name)
+        while len(self.npcs) > self.MAX_NPCS:
+            del self.npcs[next(iter(self.npcs))]
+        # Environmental threats
+        for match in WORLD_THREAT_PATTERN.finditer(response):
+            if not self._cleared(match.group(1), response):
+                self._add(self.threats, match.group(1).lower(), self.MAX_THREATS)
+        # Threats raised by this very response stay, whatever else it says about them
+        for threat in list(self.threats):
+            if threat in threats_before and self._cleared(threat, response):
+                self.threats.remove(threat)
+    
+    @staticmethod
+    def _cleared(threat: str, text: str) -> bool:
+        """True when the text says this threat is over (a clearing verb next to its name)"""
+        pattern = WORLD_THREAT_CLEARED_TEMPLATE.format(threat=re.escape(threat))
+        return re.search(pattern, text, re.IGNORECASE) is not None
+    
+    def merge(self, data: Dict[str, Any]):
+        """Merge a model-produced update ({"location", "inventory", "npcs", "threats"})"""
+        if isinstance(data.get("location"), str) and data["location"].strip():
+            self.location = data["location"].strip().lower()[:60]
+        if isinstance(data.get("inventory"), list):
+            self.inventory = [str(item).lower()[:40] for item in data["inventory"]][:self.MAX_INVENTORY]
+        if isinstance(data.get("npcs"), dict):
+            self.npcs = {str(k).lower()[:40]: str(v).lower()[:20] for k, v in list(data["npcs"].items())[:self.MAX_NPCS]}
+        if isinstance(data.get("threats"), list):
+            self.threats = [str(item).lower()[:60] for item in data["threats"]][:self.MAX_THREATS]
+    
+    def to_prompt(self) -> str:
+        """Prompt block describing the current world state"""
+        sections = [
+            ("Location", [self.location] if self.location else []),
+            ("Inventory", self.inventory),
+            ("Known NPCs", [f"{name} ({attitude})" for name, attitude in self.npcs.items()]),
+            ("Open Threats", self.threats),
+        ]
+        lines = ["WORLD STATE:"]
+        room = CONFIG["WORLD_STATE_MAX_CHARS"] - len(lines[0])
+        for label, entries in sections:
+            # Over the size limit, whole entries are dropped, oldest first
+            kept: List[str] = []
+            size = len(f"\n- {label}: ")
+            for entry in reversed(entries):
+                if size + len(entry) > room:
+                    break
+                kept.insert(0, entry)
+                size += len(entry) + 2
+            if kept:
+                lines.append(f"- {label}: {', '.join(kept)}")
+                room -= len(lines[-1]) + 1
+        return "\n".join(lines) + "\n"
+    
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "WorldState":
+        """Create world state from a saved dictionary"""
+        data = data or {}
+        return cls(
+            location=data.get("location", ""),
+            inventory=list(data.get("inventory", [])),
+            npcs=dict(data.get("npcs", {})),
+            threats=list(data.get("threats", [])),
+            turn=data.get("turn", 0)
+        )
+    
+    @staticmethod
+    def _add(items: List[str], item: str, limit: int):
+        item = item.strip()
+        if item and item not in items:
+            items.append(item)
+            del items[:-limit]
+    
+    @staticmethod
+    def _remove_matching(items: List[str], text: str):
+        for item in list(items):
+            if item in text or text in item:
+                items.remove(item)
+
+
 @dataclass
 class GameState:
     """Game state management"""
@@ -246,19 +803,32 @@ class GameState:
     role: str
     history: List[Dict[str, str]]
     start_time: Optional[datetime] = None
+    fast_model: Optional[str] = None
+    world: WorldState = field(default_factory=WorldState)
+    prompt_usage: Dict[str, Any] = field(default_factory=dict)
+    party: List[Dict[str, str]] = field(default_factory=list)  # party mode members: name and role
+    opening: str = ""  # narrated opening scene, if one was ready in the pool
     
     def __post_init__(self):
         if self.start_time is None:
             self.start_time = datetime.now()
     
-    def add_message(self, role: str, content: str):
-        """Add message to history with timestamp"""
+    def add_message(self, role: str, content: str, **fields: Any):
+        """Add message to history with timestamp (plus any extra fields, e.g. party actions)"""
         self.history.append({
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            **fields
         })
     
+    def opening_scene(self) -> str:
+        """Narrated opening from the pool, or the role's starter fragment"""
+        if self.opening:
+            return self.opening
+        opener = ROLE_STARTERS.get(self.genre, {}).get(self.role, "The atmosphere hangs with possibility when")
+        return f"{opener}..."
+    
     def get_session_duration(self) -> str:
         """Get formatted session duration"""
         if not self.start_time:
@@ -275,12 +845,828 @@ class GameState:
         """Get total number of messages exchanged"""
         return len(self.history)
     
-    def to_dict(self) -> Dict[str, Any]:
+    def snapshot(self) -> "GameState":
+        """
+        Consistent read-only copy for readers on other threads (autosave, stats, analytics)
+        The history is shared structurally, so the cost does not grow with its
+        length; the small fields are copied
+        """
+        if isinstance(self.history, PagedHistory):
+            history = self.history.snapshot()
+        else:
+            history = PagedHistory(self.history).snapshot()  # state built by hand with a plain list: copied
+        return replace(
+            self,
+            history=history,
+            world=WorldState.from_dict(asdict(self.world)),
+            prompt_usage=json.loads(json.dumps(self.prompt_usage)),
+            party=[dict(member) for member in self.party]
+        )
+    
+    def to_dict(self, include_history: bool = True) -> Dict[str, Any]:
         """Convert to dictionary for saving"""
-        return {
-            **asdict(self),
+        data = {
+            **asdict(replace(self, history=[])),
             "start_time": self.start_time.isoformat() if self.start_time else None
         }
+        if include_history:
+            data["history"] = list(self.history)
+        else:
+            del data["history"]
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GameState":
+        """Create game state from a saved dictionary"""
+        required = ["model", "player_name", "genre", "role", "history"]
+        if not all(k in data for k in required):
+            raise ValueError("Invalid save file format")
+        return cls(
+            model=data["model"],
+            player_name=data["player_name"],
+            genre=data["genre"],
+            role=data["role"],
+            history=data["history"] if isinstance(data["history"], PagedHistory) else PagedHistory(data["history"]),
+            start_time=datetime.fromisoformat(data["start_time"]) if data.get("start_time") else None,
+            fast_model=data.get("fast_model"),
+            world=WorldState.from_dict(data.get("world")),
+            prompt_usage=data.get("prompt_usage") or {},
+            party=data.get("party") or [],
+            opening=data.get("opening", "")
+        )
+
+
+class SaveStore:
+    """
+    Reads and writes saves: plain JSON or the compressed .dgsave container
+    .dgsave layout: MAGIC | uint32 header length | JSON header (metadata and block
+    index) | zlib-compressed JSON blocks of messages
+    """
+    MAGIC = b"DGSAVE1\n"
+    EXTENSIONS = (".json", ".dgsave")
+    
+    @classmethod
+    def write(cls, state: GameState, filepath: Path):
+        """Write a save in the format implied by the file extension"""
+        tmp_path = Path(filepath).with_suffix(Path(filepath).suffix + ".tmp")
+        if Path(filepath).suffix != ".dgsave":
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state.to_dict(), f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, filepath)
+            return
+        history = state.history if isinstance(state.history, PagedHistory) else PagedHistory(state.history)
+        blocks = []
+        index = []
+        offset = 0
+        for raw, messages, count in history.iter_blocks():
+            if raw is None:
+                raw = zlib.compress(json.dumps(messages, ensure_ascii=False).encode("utf-8"), CONFIG["SAVE_COMPRESSION_LEVEL"])
+            blocks.append(raw)
+            index.append({"offset": offset, "length": len(raw), "count": count})
+            offset += len(raw)
+        metadata = state.to_dict(include_history=False)
+        header = json.dumps({
+            "version": 1,
+            "metadata": metadata,
+            "message_count": len(history),
+            "block_size": history.block_size,
+            "blocks": index,
+        }, ensure_ascii=False).encode("utf-8")
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for raw in blocks:
+                f.write(raw)
+        os.replace(tmp_path, filepath)
+    
+    @classmethod
+    def read_header(cls, filepath: Path) -> Tuple[Dict[str, Any], int]:
+        """Header of a .dgsave file and the offset where its blocks start"""
+        with open(filepath, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError("Not a compressed save file")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        return header, len(cls.MAGIC) + 4 + header_len
+    
+    @classmethod
+    def read(cls, filepath: Path) -> GameState:
+        """
+        Load a save; .dgsave history blocks are read still compressed and only
+        decompressed on demand. The file is closed before this returns, so it can be
+        overwritten or replaced (also on Windows) while the game runs
+        """
+        start = time.perf_counter()
+        if Path(filepath).suffix != ".dgsave":
+            with open(filepath, 'r', encoding='utf-8') as f:
+                state = GameState.from_dict(json.load(f))
+        else:
+            header, body_offset = cls.read_header(filepath)
+            with open(filepath, 'rb') as f:
+                f.seek(body_offset)
+                body = f.read()
+            history = PagedHistory.from_blocks(body, header["blocks"], header["block_size"])
+            state = GameState.from_dict({**header["metadata"], "history": history})
+        metrics.record_time("save.load", time.perf_counter() - start)
+        return state
+
+
+class SemanticMemory:
+    """
+    Embedding index over history turns (requires numpy)
+    Turns are embedded in batches by a background thread; retrieval is a
+    vectorised cosine search over a NumPy array
+    """
+    def __init__(self, model: Optional[str] = None, session_id: str = "default"):
+        if np is None:
+            raise RuntimeError("Semantic memory requires numpy: pip install numpy")
+        self.model = model or CONFIG["EMBEDDING_MODEL"]
+        self.session_id = session_id
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._count = 0
+        self.message_indices: List[int] = []
+        self.hashes: List[str] = []
+        self._pending: List[Tuple[int, str]] = []
+        # Cutoff of every forget_from call; its length is the generation a batch was taken in
+        self._forgotten: List[int] = []
+        self._worker: Optional[threading.Thread] = None
+    
+    @staticmethod
+    def content_hash(model: str, text: str) -> str:
+        """Cache key of an embedded text"""
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def turn_text(player_text: str, world_text: str) -> str:
+        """Text embedded for one turn"""
+        return f"{player_text}\n{world_text}".strip()
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the vector array"""
+        return self._vectors.nbytes
+    
+    def embed(self, texts: List[str], priority: str = "background") -> List[Any]:
+        """Embed texts through the cache, batching all misses into as few requests as possible"""
+        vectors: List[Any] = [None] * len(texts)
+        misses = []
+        for i, text in enumerate(texts):
+            cached = embedding_cache.get(self.content_hash(self.model, text))
+            if cached is not None:
+                vectors[i] = cached
+                metrics.increment("embeddings.cache_hits")
+            else:
+                misses.append(i)
+        batch_size = CONFIG["EMBEDDING_BATCH_SIZE"]
+        for start in range(0, len(misses), batch_size):
+            batch = misses[start:start + batch_size]
+            begin = time.perf_counter()
+            embeddings = OllamaAPI.embed(self.model, [texts[i] for i in batch], self.session_id, priority)
+            metrics.record_time("embeddings.request", time.perf_counter() - begin)
+            metrics.increment("embeddings.computed", len(batch))
+            for i, embedding in zip(batch, embeddings):
+                vector = np.asarray(embedding, dtype=np.float32)
+                norm = float(np.linalg.norm(vector))
+                vector = vector / norm if norm else vector
+                embedding_cache.put(self.content_hash(self.model, texts[i]), vector)
+                vectors[i] = vector
+        return vectors
+    
+    def _append(self, message_index: int, text_hash: str, vector: Any):
+        with self._lock:
+            self._append_locked(message_index, text_hash, vector)
+    
+    def _append_locked(self, message_index: int, text_hash: str, vector: Any):
+        """Add one vector (caller holds the lock)"""
+        if self._count == 0 or self._vectors.shape[1] != vector.shape[0]:
+            self._vectors = np.zeros((max(64, self._count * 2), vector.shape[0]), dtype=np.float32)
+            self._count = 0
+            self.message_indices.clear()
+            self.hashes.clear()
+        if self._count == self._vectors.shape[0]:
+            grown = np.zeros((self._count * 2, self._vectors.shape[1]), dtype=np.float32)
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+        self._vectors[self._count] = vector
+        self.message_indices.append(message_index)
+        self.hashes.append(text_hash)
+        self._count += 1
+    
+    def add_turn(self, message_index: int, player_text: str, world_text: str):
+        """Queue a turn for background embedding"""
+        with self._lock:
+            self._pending.append((message_index, self.turn_text(player_text, world_text)))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._drain, daemon=True)
+                self._worker.start()
+    
+    def _drain(self):
+        """Background worker: embed pending turns in batches until the queue is empty"""
+        while True:
+            with self._lock:
+                batch = self._pending[:CONFIG["EMBEDDING_BATCH_SIZE"]]
+                del self._pending[:len(batch)]
+                generation = len(self._forgotten)
+                if not batch:
+                    self._worker = None
+                    return
+            try:
+                vectors = self.embed([text for _, text in batch])
+            except RuntimeError:
+                metrics.increment("embeddings.failures")
+                continue
+            with self._lock:
+                # Turns forgotten (by /redo) while this batch was embedding must not come back
+                cutoffs = self._forgotten[generation:]
+                floor = min(cutoffs) if cutoffs else None
+                for (message_index, text), vector in zip(batch, vectors):
+                    if floor is not None and message_index >= floor:
+                        metrics.increment("embeddings.stale")
+                        continue
+                    self._append_locked(message_index, self.content_hash(self.model, text), vector)
+    
+    def wait_idle(self, timeout: Optional[float] = None):
+        """Block until queued turns are embedded"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+    
+    def forget_from(self, message_index: int):
+        """Drop turns at or after a history index (used by /redo)"""
+        with self._lock:
+            self._forgotten.append(message_index)
+            self._pending = [(i, text) for i, text in self._pending if i < message_index]
+            # Indices are not sorted after a load and back-fill, so filter rather than cut
+            keep = np.asarray(self.message_indices, dtype=np.int64) < message_index
+            if keep.all():
+                return
+            # A new array: searches outside the lock may still be reading the old one
+            self._vectors = self._vectors[:self._count][keep]
+            self.message_indices = [i for i, kept in zip(self.message_indices, keep) if kept]
+            self.hashes = [h for h, kept in zip(self.hashes, keep) if kept]
+            self._count = len(self.message_indices)
+    
+    def search(self, query: str, k: int, before_index: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (message_index, score) by cosine similarity, optionally only turns before an index"""
+        with self._lock:
+            count = self._count
+            vectors = self._vectors[:count]
+            indices = np.asarray(self.message_indices[:count], dtype=np.int64)
+        if count == 0:
+            return []
+        # The query is on the turn's critical path
+        query_vector = self.embed([query], priority="interactive")[0]
+        if query_vector.shape[0] != vectors.shape[1]:
+            return []
+        scores = vectors @ query_vector
+        if before_index is not None:
+            scores = np.where(indices < before_index, scores, -np.inf)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(indices[i]), float(scores[i])) for i in top
+                if np.isfinite(scores[i]) and scores[i] >= CONFIG["MEMORY_MIN_SCORE"]]
+    
+    @staticmethod
+    def index_path(save_path: Path) -> Path:
+        """Index file stored next to a save"""
+        return Path(save_path).with_suffix(".vec.npz")
+    
+    def save(self, save_path: Path, before_index: Optional[int] = None):
+        """Persist the vectors next to the session save (only turns before an index, if given)"""
+        with self._lock:
+            count = self._count
+            indices = np.asarray(self.message_indices[:count], dtype=np.int64)
+            keep = indices < before_index if before_index is not None else np.ones(count, dtype=bool)
+            vectors = self._vectors[:count][keep]
+            indices = indices[keep]
+            hashes = np.asarray(self.hashes[:count])[keep]
+        path = self.index_path(save_path)
+        with open(path, 'wb') as f:
+            np.savez(f, vectors=vectors, indices=indices, hashes=hashes, model=np.asarray(self.model))
+    
+    @classmethod
+    def load(cls, save_path: Path, session_id: str = "default") -> Optional["SemanticMemory"]:
+        """Load the index saved next to a session save, if any"""
+        path = cls.index_path(save_path)
+        if np is None or not path.exists():
+            return None
+        with np.load(path) as data:
+            memory = cls(str(data["model"]), session_id)
+            for vector, message_index, text_hash in zip(data["vectors"], data["indices"], data["hashes"]):
+                memory._append(int(message_index), str(text_hash), vector)
+                embedding_cache.put(str(text_hash), vector)
+        return memory
+
+
+class EmbeddingCache:
+    """LRU of normalized embedding vectors keyed by content hash"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Cached vector or None"""
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+    
+    def put(self, key: str, vector: Any):
+        """Store a vector, evicting the least recently used"""
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > CONFIG["EMBEDDING_CACHE_SIZE"]:
+                self._entries.popitem(last=False)
+
+
+embedding_cache = EmbeddingCache()
+
+
+class ResponseCache:
+    """Content-addressed LRU (memory) + persistent (disk) cache for seeded generations"""
+    def __init__(self, max_entries: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_entries = max_entries
+    
+    @staticmethod
+    def make_key(model: str, prompt: str, options: Dict[str, Any]) -> str:
+        """Key on model, prompt hash, generation options and seed"""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps(
+            {"model": model, "prompt": prompt_hash, "options": options, "seed": options.get("seed")},
+            sort_keys=True
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _disk_path(key: str) -> Path:
+        return Path(CONFIG["CACHE_DIR"]) / "responses" / key[:2] / f"{key}.json"
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up an entry in memory, then on disk"""
+        max_entries = self.max_entries or CONFIG["RESPONSE_CACHE_SIZE"]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.increment("cache.hits")
+                return entry
+        if CONFIG["RESPONSE_CACHE_DISK"]:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self._entries[key] = entry
+                    while len(self._entries) > max_entries:
+                        self._entries.popitem(last=False)
+                metrics.increment("cache.hits")
+                metrics.increment("cache.disk_hits")
+                return entry
+        metrics.increment("cache.misses")
+        return None
+    
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Store an entry in memory and, if enabled, on disk"""
+        max_entries = self.max_entries or CONFIG["RESPONSE_CACHE_SIZE"]
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("cache.evictions")
+        if CONFIG["RESPONSE_CACHE_DISK"]:
+            path = self._disk_path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass  # Disk cache is best effort
+    
+    def clear(self):
+        """Drop the in-memory entries"""
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+class SchedulerBusy(RuntimeError):
+    """Raised when the generation scheduler refuses new work (backpressure)"""
+
+
+class DeadlineExceeded(RuntimeError):
+    """A generation produced no usable text before its deadline"""
+
+
+class GenerationCancelled(Exception):
+    """A generation was abandoned through its CancelToken"""
+
+
+class CancelToken:
+    """
+    Cancels a request wherever it is: set() runs the callbacks registered by the
+    code currently holding it (wake a scheduler wait, shut a stream's socket down)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self._set = False
+    
+    def is_set(self) -> bool:
+        return self._set
+    
+    def set(self):
+        with self._lock:
+            if self._set:
+                return
+            self._set = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+    
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        """Run callback if the token is set while the block runs (at once if it already is)"""
+        with self._lock:
+            run_now = self._set
+            if not run_now:
+                self._callbacks.append(callback)
+        if run_now:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+class GenerationScheduler:
+    """
+    Client-side scheduler shared by all sessions talking to one Ollama host
+    Interactive requests go before background work (summaries, warm-ups,
+    embeddings); within a priority, sessions are served weighted round-robin.
+    In-flight requests are capped to the backend's parallel slots
+    """
+    PRIORITIES = ("interactive", "background")
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues: Dict[str, "OrderedDict[str, List[Dict[str, Any]]]"] = {p: OrderedDict() for p in self.PRIORITIES}
+        self._credits: Dict[str, int] = {}
+        self._in_flight = {p: 0 for p in self.PRIORITIES}
+        self.weights: Dict[str, int] = {}
+    
+    def set_weight(self, session_id: str, weight: int):
+        """Consecutive requests a session may dispatch per round-robin turn"""
+        with self._cond:
+            self.weights[session_id] = max(1, weight)
+    
+    def queue_depth(self, priority: Optional[str] = None) -> int:
+        """Requests waiting for a slot"""
+        with self._cond:
+            return sum(self.queue_depth_locked(p) for p in ([priority] if priority else self.PRIORITIES))
+    
+    def _dispatch(self):
+        """Grant free slots to waiting tickets (caller holds the lock)"""
+        while sum(self._in_flight.values()) < CONFIG["MAX_PARALLEL_GENERATIONS"]:
+            for priority in self.PRIORITIES:
+                if priority == "background" and self._in_flight["background"] >= CONFIG["SCHEDULER_BACKGROUND_SLOTS"]:
+                    continue
+                sessions = self._queues[priority]
+                if sessions:
+                    break
+            else:
+                return
+            session_id, tickets = next(iter(sessions.items()))
+            ticket = tickets.pop(0)
+            credits = self._credits.get(session_id, self.weights.get(session_id, 1)) - 1
+            if not tickets:
+                del sessions[session_id]
+                self._credits.pop(session_id, None)
+            elif credits <= 0:
+                # Turn used up: go to the back of the rotation
+                sessions.move_to_end(session_id)
+                self._credits[session_id] = self.weights.get(session_id, 1)
+            else:
+                self._credits[session_id] = credits
+            ticket["granted"] = True
+            self._in_flight[priority] += 1
+            self._cond.notify_all()
+    
+    @contextmanager
+    def slot(self, session_id: str = "default", priority: str = "interactive", timeout: Optional[float] = None,
+             cancel: Optional[CancelToken] = None):
+        """
+        Wait for a generation slot; raises SchedulerBusy when queues are full or the
+        wait times out, and GenerationCancelled when cancel is set before a slot is free
+        """
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        ticket = {"granted": False}
+        enqueued = time.perf_counter()
+        with self._cond:
+            queue = self._queues[priority].setdefault(session_id, [])
+            if len(queue) >= CONFIG["SCHEDULER_MAX_QUEUE_PER_SESSION"]:
+                if not queue:
+                    del self._queues[priority][session_id]
+                metrics.increment(f"scheduler.rejected.{priority}")
+                raise SchedulerBusy("Too many pending requests for this session - wait for the world to respond")
+            if priority == "background" and self.queue_depth_locked("background") >= CONFIG["SCHEDULER_MAX_BACKGROUND_QUEUE"]:
+                if not queue:
+                    del self._queues[priority][session_id]
+                metrics.increment("scheduler.rejected.background")
+                raise SchedulerBusy("Background queue is full")
+            queue.append(ticket)
+            self._dispatch()
+            deadline = None if timeout is None else enqueued + timeout
+            with cancel.on_cancel(self.wake) if cancel is not None else nullcontext():
+                while not ticket["granted"]:
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if cancel is not None and cancel.is_set():
+                        self._withdraw(ticket, priority, session_id)
+                        metrics.increment(f"scheduler.cancelled.{priority}")
+                        raise GenerationCancelled()
+                    if remaining is not None and remaining <= 0:
+                        self._withdraw(ticket, priority, session_id)
+                        metrics.increment(f"scheduler.timeouts.{priority}")
+                        raise SchedulerBusy("Timed out waiting for a generation slot")
+                    self._cond.wait(remaining)
+            metrics.set_gauge(f"scheduler.queue_depth.{priority}", self.queue_depth_locked(priority))
+        metrics.record_time(f"scheduler.queue_time.{priority}", time.perf_counter() - enqueued)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight[priority] -= 1
+                self._dispatch()
+                self._cond.notify_all()
+    
+    def _withdraw(self, ticket: Dict[str, Any], priority: str, session_id: str):
+        """Take a waiting ticket out of its queue (caller holds the lock)"""
+        queue = self._queues[priority].get(session_id, [])
+        if ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[priority][session_id]
+            self._cond.notify_all()
+    
+    def wake(self):
+        """Make waiting requests re-check their state (used when one is cancelled)"""
+        with self._cond:
+            self._cond.notify_all()
+    
+    def load(self, priority: str) -> int:
+        """Requests of a priority in flight or waiting"""
+        with self._cond:
+            return self._in_flight[priority] + self.queue_depth_locked(priority)
+    
+    def wait_idle(self, priority: str, timeout: Optional[float] = None) -> bool:
+        """Block until no request of a priority is in flight or waiting; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._in_flight[priority] + self.queue_depth_locked(priority) == 0, timeout)
+    
+    def queue_depth_locked(self, priority: str) -> int:
+        """queue_depth for callers already holding the lock"""
+        return sum(len(q) for q in self._queues[priority].values())
+
+
+scheduler = GenerationScheduler()
+
+
+FILLER_PHRASES = [
+    "As you ",
+    "You see that ",
+    "It appears that ",
+    "It seems that ",
+    "You notice that ",
+    "You realize that ",
+    "Suddenly, ",
+    "Without warning, ",
+    "Out of nowhere, ",
+]
+PASSIVE_REWRITES = {
+    " is seen ": " appears ",
+    " can be heard ": " sounds ",
+    " is felt ": " feels ",
+}
+STOP_PATTERN = re.compile("|".join(re.escape(token) for token in STOP_TOKENS))
+FILLER_PATTERN = re.compile("|".join(re.escape(phrase) for phrase in FILLER_PHRASES), re.IGNORECASE)
+PASSIVE_PATTERN = re.compile("|".join(re.escape(phrase) for phrase in PASSIVE_REWRITES))
+CONSEQUENCE_PATTERN = re.compile(r"(?:you|i)\s+\S+\s+(?:see|notice|feel|hear)\s+(?=\S)", re.IGNORECASE)
+# A sentence ends at . ! or ? (plus closing quotes/brackets) followed by whitespace
+# and an uppercase letter, digit or opening quote - or at the end of the text
+SENTENCE_END_PATTERN = re.compile(r"""[.!?]+["')\]]*(?=\s+["'(\[]?[A-Z0-9]|\s*$)""")
+ABBREVIATION_PATTERN = re.compile(r"\b(?:Mr|Mrs|Ms|Dr|St|Sr|Jr|Prof|Capt|Gen|Col|Lt|Sgt|Mt|vs|etc|e\.g|i\.e)\.$")
+POSTPROCESS_GOLDEN_CASES = [
+    ("Your sword strikes the orc.", "Your sword strikes the orc."),
+    ("Suddenly, the door bursts open. Dust fills the air.", "The door bursts open. Dust fills the air."),
+    ("As you swing, the blade bites deep. The orc howls.", "Swing, the blade bites deep. The orc howls."),
+    ("One. Two. Three. Four. Five. Six.", "One. Two. Three. Four."),
+    ("Mr. Holmes nods. Dr. Watson frowns. The fire crackles. A clock chimes. Rain falls.",
+     "Mr. Holmes nods. Dr. Watson frowns. The fire crackles. A clock chimes."),
+    ("The blade flashes! Sparks fly? The guard staggers. He falls. Silence.",
+     "The blade flashes! Sparks fly? The guard staggers. He falls."),
+    ("A scream can be heard from the hall. Smoke is seen rising.", "A scream sounds from the hall. Smoke appears rising."),
+    ("A distant bell is seen swaying. The cold is felt everywhere.", "A distant bell appears swaying. The cold feels everywhere."),
+    ("You can see the dragon stirring in its lair.", "The dragon stirring in its lair."),
+    ("The lock clicks open.\nPlayer: I open the door", "The lock clicks open."),
+    ("The guard drops his spear. Dungeon Master: next", "The guard drops his spear."),
+    ("\"Halt!\" the guard shouts. He raises his spear. You freeze. Boots echo. Torches flare.",
+     "\"Halt!\" the guard shouts. He raises his spear. You freeze. Boots echo."),
+    ("It seems that the Baron of Ravenholm laughs at you.", "The Baron of Ravenholm laughs at you."),
+    ("The coin spins 3.5 times on the table. It lands on its edge.", "The coin spins 3.5 times on the table. It lands on its edge."),
+]
+
+
+class ResponsePostProcessor:
+    """
+    Response clean-up built from precompiled patterns
+    Steps (CONFIG["POSTPROCESS_STEPS"]): stop_tokens, filler, sentence_limit,
+    passive_voice, consequence_first
+    """
+    @staticmethod
+    def _capitalize_first(text: str) -> str:
+        return text[:1].upper() + text[1:]
+    
+    @staticmethod
+    def cut_stop_tokens(text: str) -> Tuple[str, bool]:
+        """Text before the first stop token"""
+        match = STOP_PATTERN.search(text)
+        return (text[:match.start()], True) if match else (text, False)
+    
+    @classmethod
+    def strip_filler(cls, text: str) -> str:
+        """Remove leading filler phrases"""
+        while match := FILLER_PATTERN.match(text):
+            text = cls._capitalize_first(text[match.end():])
+        return text
+    
+    @staticmethod
+    def sentence_ends(text: str) -> Iterator[int]:
+        """Offsets just past each sentence terminator, skipping abbreviations"""
+        for match in SENTENCE_END_PATTERN.finditer(text):
+            if ABBREVIATION_PATTERN.search(text, 0, match.end()) and match.end() < len(text.rstrip()):
+                continue
+            yield match.end()
+    
+    @classmethod
+    def limit_sentences(cls, text: str, limit: int) -> str:
+        """Keep the first `limit` sentences"""
+        for count, end in enumerate(cls.sentence_ends(text), 1):
+            if count == limit:
+                return text[:end]
+        return text
+    
+    @staticmethod
+    def rewrite_passive(text: str) -> str:
+        """Replace common passive constructions in one pass"""
+        return PASSIVE_PATTERN.sub(lambda match: PASSIVE_REWRITES[match.group(0)], text)
+    
+    @classmethod
+    def consequence_first(cls, text: str) -> str:
+        """Drop a leading 'You can see/notice/feel/hear' construction"""
+        match = CONSEQUENCE_PATTERN.match(text)
+        return cls._capitalize_first(text[match.end():]) if match else text
+    
+    @classmethod
+    def complete_sentences(cls, text: str) -> str:
+        """Drop a trailing unfinished sentence (keeps the text if no sentence is complete)"""
+        ends = list(cls.sentence_ends(text))
+        return text[:ends[-1]] if ends else text
+    
+    @classmethod
+    def process(cls, text: str, steps: Optional[List[str]] = None,
+                report: Optional[Dict[str, bool]] = None) -> str:
+        """Run the pipeline on a full response; report (if given) records which steps changed it"""
+        steps = CONFIG["POSTPROCESS_STEPS"] if steps is None else steps
+        text = text.strip()
+        for step in steps:
+            before = text
+            if step == "stop_tokens":
+                text = cls.cut_stop_tokens(text)[0].strip()
+            elif step == "filler":
+                text = cls.strip_filler(text)
+            elif step == "sentence_limit":
+                text = cls.limit_sentences(text, CONFIG["MAX_RESPONSE_SENTENCES"])
+            elif step == "passive_voice":
+                text = cls.rewrite_passive(text)
+            elif step == "consequence_first":
+                text = cls.consequence_first(text)
+            if report is not None:
+                report[step] = report.get(step, False) or text != before
+        return text.strip()
+    
+    @classmethod
+    def stream(cls, steps: Optional[List[str]] = None) -> "StreamPostProcessor":
+        """Incremental processor for a token stream"""
+        return StreamPostProcessor(steps)
+
+
+class StreamPostProcessor:
+    """
+    Applies ResponsePostProcessor to a token stream
+    Complete sentences are cleaned and released as soon as their end is known;
+    feed() returns newly released text, finish() the rest
+    """
+    MAX_STOP_TOKEN_LEN = max(len(token) for token in STOP_TOKENS)
+    
+    def __init__(self, steps: Optional[List[str]] = None):
+        self.steps = CONFIG["POSTPROCESS_STEPS"] if steps is None else steps
+        self.buffer = ""
+        self.scanned = 0  # buffer offset already checked for stop tokens
+        self.sentences = 0
+        self.released: List[str] = []
+        self.done = False
+    
+    @property
+    def text(self) -> str:
+        """Text released so far"""
+        return "".join(self.released)
+    
+    def pending(self) -> str:
+        """Raw text of the sentence currently being received"""
+        return "" if self.done else self.buffer.strip()
+    
+    def _clean_sentence(self, sentence: str, first: bool) -> str:
+        if first:
+            sentence = sentence.lstrip()
+            if "filler" in self.steps:
+                sentence = ResponsePostProcessor.strip_filler(sentence)
+        if "passive_voice" in self.steps:
+            sentence = ResponsePostProcessor.rewrite_passive(sentence)
+        if first and "consequence_first" in self.steps:
+            sentence = ResponsePostProcessor.consequence_first(sentence)
+        return sentence
+    
+    def _release(self, final: bool) -> str:
+        out = []
+        while not self.done:
+            end = None
+            for candidate in ResponsePostProcessor.sentence_ends(self.buffer):
+                # Without lookahead we cannot tell a sentence end from the end of the buffer yet
+                if final or candidate < len(self.buffer.rstrip()):
+                    end = candidate
+                    break
+            if end is None:
+                if final and self.buffer.strip():
+                    end = len(self.buffer.rstrip())
+                else:
+                    break
+            sentence, self.buffer = self.buffer[:end], self.buffer[end:]
+            self.scanned = 0
+            cleaned = self._clean_sentence(sentence, first=not self.released and not out)
+            if cleaned.strip():
+                out.append(cleaned)
+                self.sentences += 1
+            if "sentence_limit" in self.steps and self.sentences >= CONFIG["MAX_RESPONSE_SENTENCES"]:
+                self.done = True
+        text = "".join(out)
+        if text:
+            self.released.append(text)
+        return text
+    
+    def feed(self, token: str) -> str:
+        """Add a chunk; returns newly released clean text"""
+        if self.done:
+            return ""
+        self.buffer += token
+        if "stop_tokens" in self.steps:
+            # Only rescan the part of the buffer a new stop token could touch
+            start = max(0, self.scanned - self.MAX_STOP_TOKEN_LEN)
+            match = STOP_PATTERN.search(self.buffer, start)
+            self.scanned = len(self.buffer)
+            if match:
+                self.buffer = self.buffer[:match.start()].rstrip()
+                text = self._release(final=True)
+                self.done = True
+                return text
+        return self._release(final=False)
+    
+    def finish(self) -> str:
+        """Release whatever is left at the end of the stream"""
+        if self.done:
+            return ""
+        self.buffer = self.buffer.rstrip()
+        text = self._release(final=True)
+        self.done = True
+        return text
 
 
 class OllamaAPI:
@@ -313,6 +1699,104 @@ class OllamaAPI:
         except Exception as e:
             raise RuntimeError(f"Request failed: {e}")
     
+    @staticmethod
+    def http_stream(url: str, data: Dict) -> Iterator[Dict[str, Any]]:
+        """POST and yield each JSON line of a streaming (NDJSON) response"""
+        req = urllib.request.Request(
+            url,
+            data=json.dumps(data).encode("utf-8"),
+            headers={"Accept": "application/x-ndjson", "Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=CONFIG["REQUEST_TIMEOUT"]) as resp:
+                for line in resp:
+                    if line.strip():
+                        yield json.loads(line.decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"HTTP Error {e.code}: {e.reason}")
+        except urllib.error.URLError as e:
+            raise RuntimeError(f"Connection Error: {e.reason}. Is Ollama running?")
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f"Invalid JSON response: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Request failed: {e}")
+    
+    @classmethod
+    def stream_until(cls, url: str, data: Dict, deadline: Optional[float] = None,
+                     first_token_deadline: Optional[float] = None,
+                     cancel: Optional[CancelToken] = None) -> Iterator[Dict[str, Any]]:
+        """
+        http_stream that can be abandoned: at a deadline (time.perf_counter() value) it
+        raises DeadlineExceeded, and when cancel is set GenerationCancelled. The socket
+        is then shut down right away, even while Ollama is still loading the model or
+        evaluating the prompt, so the server sees the disconnect and abandons the
+        generation before the next request is sent
+        """
+        parts = urllib.parse.urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(parts.hostname, parts.port, timeout=CONFIG["REQUEST_TIMEOUT"])
+        try:
+            connection.connect()
+        except OSError as e:
+            raise RuntimeError(f"Connection Error: {e}. Is Ollama running?")
+        # Kept here: http.client drops connection.sock once a closing response is read
+        sock = connection.sock
+        chunks: "queue.Queue[Any]" = queue.Queue()
+        finished = threading.Event()
+        def read():
+            try:
+                connection.request("POST", parts.path or "/", body=json.dumps(data).encode("utf-8"),
+                                   headers={"Accept": "application/x-ndjson", "Content-Type": "application/json"})
+                resp = connection.getresponse()
+                if resp.status >= 400:
+                    raise RuntimeError(f"HTTP Error {resp.status}: {resp.reason}")
+                for line in resp:
+                    if finished.is_set():
+                        break
+                    if line.strip():
+                        chunks.put(json.loads(line.decode("utf-8")))
+            except RuntimeError as e:
+                chunks.put(e)
+            except json.JSONDecodeError as e:
+                chunks.put(RuntimeError(f"Invalid JSON response: {e}"))
+            except (OSError, http.client.HTTPException) as e:
+                if not finished.is_set():
+                    chunks.put(RuntimeError(f"Request failed: {e}"))
+            finally:
+                connection.close()
+            chunks.put(None)
+        threading.Thread(target=read, daemon=True).start()
+        def drop():
+            # Unblocks the reader if it is still waiting for headers or the next chunk
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # already closed by the reader
+        def abandon():
+            chunks.put(GenerationCancelled())
+            drop()
+        waiting_for_text = first_token_deadline is not None
+        try:
+            with cancel.on_cancel(abandon) if cancel is not None else nullcontext():
+                while True:
+                    limit = first_token_deadline if waiting_for_text else deadline
+                    try:
+                        item = chunks.get(timeout=None if limit is None else max(0.0, limit - time.perf_counter()))
+                    except queue.Empty:
+                        raise DeadlineExceeded("No response before the first-token deadline" if waiting_for_text
+                                               else "Turn deadline reached")
+                    if item is None:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    if item.get("response"):
+                        waiting_for_text = False
+                    yield item
+        finally:
+            finished.set()
+            drop()
+    
     @classmethod
     def list_models(cls) -> List[str]:
         """Get list of available models with fallback methods"""
@@ -359,71 +1843,151 @@ class OllamaAPI:
         return sorted(set(models))
     
     @classmethod
-    def generate(cls, model: str, prompt: str) -> str:
-        """Generate text with streaming feedback"""
+    def generate(cls, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                 stats: Optional[Dict[str, Any]] = None, use_cache: bool = True,
+                 on_token: Optional[Callable[[str], None]] = None,
+                 session_id: str = "default", priority: str = "interactive",
+                 deadline: Optional[float] = None, first_token_deadline: Optional[float] = None,
+                 postprocess_steps: Optional[List[str]] = None, cancel: Optional[CancelToken] = None) -> str:
+        """
+        Generate text with streaming feedback
+        options override GENERATION_OPTIONS; if stats is given it is filled with
+        the raw response and Ollama's token counters. With a fixed CONFIG["SEED"]
+        results are served from / stored in the response cache unless use_cache is False.
+        If on_token is given the response is streamed and each chunk is passed to it.
+        Requests wait for a slot from the shared GenerationScheduler.
+        deadline and first_token_deadline are time.perf_counter() values: at the
+        deadline the text streamed so far is returned (cut at a sentence boundary,
+        stats["deadline_hit"] set); DeadlineExceeded is raised if there is none yet.
+        postprocess_steps overrides CONFIG["POSTPROCESS_STEPS"] ([] returns the raw text).
+        Setting cancel raises GenerationCancelled, whether the request is still queued
+        for a slot or already streaming (its connection is dropped)
+        """
         url = f'{CONFIG["OLLAMA_URL"].rstrip("/")}/api/generate'
+        merged_options = {**GENERATION_OPTIONS, **(options or {})}
+        if CONFIG["SEED"] is not None and "seed" not in merged_options:
+            merged_options["seed"] = CONFIG["SEED"]
         payload = {
             "model": model,
             "prompt": prompt,
             "stream": False,
-            "options": {
-                "temperature": 0.8,
-                "stop": STOP_TOKENS,
-                "num_ctx": 4096,
-                "top_p": 0.9,
-                "num_predict": 250,
-                "frequency_penalty": 0.5,
-                "presence_penalty": 0.5,
-            },
+            "options": merged_options,
         }
+        cache_key = None
+        if use_cache and merged_options.get("seed") is not None:
+            cache_key = response_cache.make_key(model, prompt, merged_options)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                if stats is not None:
+                    stats.update(cached["stats"])
+                    stats["cached"] = True
+                if on_token is not None:
+                    on_token(cached["response"])
+                return cached["response"]
         try:
-            data = cls.http_request(url, method="POST", data=payload)
-            response = data.get("response", "").strip()
-            # Clean up stop tokens
-            for token in STOP_TOKENS:
-                if token in response:
-                    response = response.split(token)[0].strip()
-            return cls.enhance_response(response)
+            start = time.perf_counter()
+            first_token_time = None
+            deadline_hit = False
+            slot_timeout = CONFIG["REQUEST_TIMEOUT"]
+            if deadline is not None:
+                slot_timeout = max(0.0, min(slot_timeout, deadline - start))
+            with scheduler.slot(session_id, priority, timeout=slot_timeout, cancel=cancel):
+                if on_token is None and deadline is None and cancel is None:
+                    data = cls.http_request(url, method="POST", data=payload)
+                    raw_response = data.get("response", "")
+                else:
+                    # A deadline needs streaming too: it is what leaves a partial response to return
+                    payload["stream"] = True
+                    parts = []
+                    data = {}
+                    if deadline is None and cancel is None:
+                        chunks = cls.http_stream(url, payload)
+                    else:
+                        chunks = cls.stream_until(url, payload, deadline, first_token_deadline, cancel)
+                    try:
+                        for chunk in chunks:
+                            text = chunk.get("response", "")
+                            if text:
+                                if first_token_time is None:
+                                    first_token_time = time.perf_counter() - start
+                                parts.append(text)
+                                if on_token is not None:
+                                    on_token(text)
+                            if chunk.get("done"):
+                                data = chunk
+                    except DeadlineExceeded:
+                        if not "".join(parts).strip():
+                            metrics.increment("deadline.no_output")
+                            raise
+                        deadline_hit = True
+                        data = {"done_reason": "deadline"}
+                        metrics.increment("deadline.hits")
+                    raw_response = "".join(parts)
+            postprocess_report: Dict[str, bool] = {}
+            response = ResponsePostProcessor.process(raw_response, steps=postprocess_steps, report=postprocess_report)
+            if deadline_hit:
+                response = ResponsePostProcessor.complete_sentences(response)
+            call_stats = {
+                "model": model,
+                "options": merged_options,
+                "raw_response": raw_response,
+                "eval_count": data.get("eval_count", 0),
+                "prompt_eval_count": data.get("prompt_eval_count", 0),
+                "eval_duration": data.get("eval_duration", 0),
+                "prompt_eval_duration": data.get("prompt_eval_duration", 0),
+                "done_reason": data.get("done_reason", ""),
+                "time_to_first_token": first_token_time,
+                "postprocess": [step for step, changed in postprocess_report.items() if changed],
+                "deadline_hit": deadline_hit,
+            }
+            if stats is not None:
+                stats.update(call_stats)
+            if cache_key is not None and not deadline_hit:
+                response_cache.put(cache_key, {"response": response, "stats": call_stats})
+            return response
         except RuntimeError as e:
             # Check if model exists
             if "not found" in str(e).lower():
                 raise RuntimeError(f"Model '{model}' not found. Available models: {', '.join(cls.list_models()[:5])}...")
             raise
     
-    @staticmethod
-    def enhance_response(response: str) -> str:
-        """Enhance AI response for better action-dependency"""
-        # Remove common AI filler phrases
-        filler_phrases = [
-            "As you ",
-            "You see that ",
-            "It appears that ",
-            "It seems that ",
-            "You notice that ",
-            "You realize that ",
-            "Suddenly, ",
-            "Without warning, ",
-            "Out of nowhere, ",
-        ]
-        for phrase in filler_phrases:
-            if response.lower().startswith(phrase.lower()):
-                response = response[len(phrase):].capitalize()
-        # Ensure response is direct and action-focused
-        lines = response.split('. ')
-        if len(lines) > 4:
-            response = '. '.join(lines[:4]) + '.'
-        # Remove passive voice where possible
-        response = response.replace(" is seen ", " appears ")
-        response = response.replace(" can be heard ", " sounds ")
-        response = response.replace(" is felt ", " feels ")
-        # Ensure consequence-first structure
-        if response.lower().startswith(("you ", "i ")):
-            # Try to rephrase to start with action consequence
-            words = response.split()
-            if len(words) > 3 and words[2].lower() in ["see", "notice", "feel", "hear"]:
-                # Skip "You see/notice/feel/hear" constructions
-                response = ' '.join(words[3:]).capitalize()
-        return response.strip()
+    @classmethod
+    def embed(cls, model: str, texts: List[str], session_id: str = "default",
+              priority: str = "background") -> List[List[float]]:
+        """Embed a batch of texts (falls back to the single-text endpoint of older Ollama versions)"""
+        base_url = CONFIG["OLLAMA_URL"].rstrip("/")
+        with scheduler.slot(session_id, priority, timeout=CONFIG["REQUEST_TIMEOUT"]):
+            try:
+                data = cls.http_request(f"{base_url}/api/embed", method="POST", data={"model": model, "input": texts})
+                return data.get("embeddings", [])
+            except RuntimeError as e:
+                if "404" not in str(e):
+                    raise
+            return [
+                cls.http_request(f"{base_url}/api/embeddings", method="POST",
+                                 data={"model": model, "prompt": text}).get("embedding", [])
+                for text in texts
+            ]
+    
+    @classmethod
+    def generate_json(cls, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                      session_id: str = "default", priority: str = "background") -> Dict[str, Any]:
+        """Generate a JSON object (Ollama's format=json mode)"""
+        url = f'{CONFIG["OLLAMA_URL"].rstrip("/")}/api/generate'
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "format": "json",
+            "options": {"temperature": 0.2, "num_predict": 200, **(options or {})},
+        }
+        with scheduler.slot(session_id, priority, timeout=CONFIG["REQUEST_TIMEOUT"]):
+            data = cls.http_request(url, method="POST", data=payload)
+        try:
+            result = json.loads(data.get("response", ""))
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f"Invalid JSON response: {e}")
+        return result if isinstance(result, dict) else {}
 
 
 class ActionAnalyzer:
@@ -547,6 +2111,492 @@ class ActionAnalyzer:
         return " ".join(context) if context else ""
 
 
+class ModelRouter:
+    """Routes each turn to a model tier: fast for routine actions, full for dramatic scenes"""
+    TIERS = ("fast", "full")
+    
+    @staticmethod
+    def choose_tier(analysis: Dict[str, Any], prompt: str) -> str:
+        """Pick the tier an action deserves"""
+        if len(prompt) >= CONFIG["FULL_TIER_PROMPT_CHARS"]:
+            return "full"
+        if (analysis["type"] in CONFIG["FULL_TIER_ACTION_TYPES"] and
+                analysis["intensity"] in CONFIG["FULL_TIER_INTENSITIES"]):
+            return "full"
+        return "fast"
+    
+    @classmethod
+    def route(cls, state: "GameState", analysis: Dict[str, Any], prompt: str) -> Tuple[str, str]:
+        """Returns (tier, model) for this turn"""
+        fast_model = state.fast_model or CONFIG["FAST_MODEL"]
+        if not fast_model or fast_model == state.model:
+            return "full", state.model
+        tier = cls.choose_tier(analysis, prompt)
+        return tier, fast_model if tier == "fast" else state.model
+    
+    @staticmethod
+    def record(tier: str, seconds: float):
+        """Record latency for a generation served by a tier"""
+        metrics.increment(f"tier.{tier}.turns")
+        metrics.record_time(f"tier.{tier}.latency", seconds)
+    
+    @classmethod
+    def tier_summary(cls) -> Dict[str, Any]:
+        """Per-tier usage and latency, plus estimated time saved by the fast tier"""
+        summary = {tier: metrics.get_timing(f"tier.{tier}.latency") for tier in cls.TIERS}
+        fast, full = summary["fast"], summary["full"]
+        saved = 0.0
+        if fast["count"] and full["count"]:
+            saved = max(0.0, fast["count"] * (full["avg"] - fast["avg"]))
+        summary["estimated_seconds_saved"] = saved
+        return summary
+
+
+class GenerationTuner:
+    """Learns useful response lengths per model and action type to size num_predict and num_ctx"""
+    def __init__(self):
+        self.observations: Dict[Tuple[str, str], List[int]] = {}
+        self.chars_per_token: Dict[str, float] = {}
+        self.num_ctx: Dict[str, int] = {}
+        self.turn_log: List[Dict[str, Any]] = []
+    
+    def _samples(self, model: str, action_type: str) -> List[int]:
+        """Observations for this action type, falling back to all types of the model"""
+        samples = self.observations.get((model, action_type), [])
+        if len(samples) >= CONFIG["ADAPTIVE_MIN_SAMPLES"]:
+            return samples
+        pooled = [n for (m, _), values in self.observations.items() if m == model for n in values]
+        return pooled if len(pooled) >= CONFIG["ADAPTIVE_MIN_SAMPLES"] else []
+    
+    def estimate_prompt_tokens(self, model: str, prompt: str) -> int:
+        """Estimate prompt tokens using the ratio observed from Ollama's prompt_eval_count"""
+        return int(len(prompt) / self.chars_per_token.get(model, CHARS_PER_TOKEN)) + 1
+    
+    def options_for(self, model: str, action_type: str, prompt: str) -> Dict[str, Any]:
+        """Generation options for the next turn"""
+        if not CONFIG["ADAPTIVE_GENERATION"]:
+            return {}
+        margin = 1 + CONFIG["ADAPTIVE_SAFETY_MARGIN"]
+        num_predict = CONFIG["NUM_PREDICT_MAX"]
+        samples = sorted(self._samples(model, action_type))
+        if samples:
+            # 90th percentile of useful length, plus a safety margin
+            p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+            num_predict = max(CONFIG["NUM_PREDICT_MIN"], min(CONFIG["NUM_PREDICT_MAX"], int(p90 * margin) + 1))
+        # Changing num_ctx forces Ollama to reload the model, so it grows in
+        # 1024-token steps and only shrinks once real token counts were seen
+        # and the need falls below half
+        needed = int((self.estimate_prompt_tokens(model, prompt) + num_predict) * margin)
+        current = self.num_ctx.get(model, GENERATION_OPTIONS["num_ctx"])
+        if needed > current or (model in self.chars_per_token and needed < current // 2):
+            current = -(-needed // 1024) * 1024
+            current = max(CONFIG["NUM_CTX_MIN"], min(CONFIG["NUM_CTX_MAX"], current))
+            self.num_ctx[model] = current
+        return {"num_predict": num_predict, "num_ctx": current}
+    
+    def observe(self, model: str, action_type: str, prompt: str, stats: Dict[str, Any], final_response: str) -> Dict[str, Any]:
+        """Record how many decoded tokens survived post-processing; returns the turn record"""
+        decoded = stats.get("eval_count", 0)
+        raw = stats.get("raw_response", "")
+        if raw.strip():
+            useful = int(round(decoded * min(1.0, len(final_response) / len(raw.strip()))))
+        else:
+            useful = 0
+        if stats.get("done_reason") == "length":
+            # Output was cut by num_predict: the real need is larger than what we saw
+            useful = int(decoded * (1 + CONFIG["ADAPTIVE_SAFETY_MARGIN"]))
+        samples = self.observations.setdefault((model, action_type), [])
+        samples.append(max(useful, 1))
+        del samples[:-CONFIG["ADAPTIVE_WINDOW"]]
+        if stats.get("prompt_eval_count"):
+            self.chars_per_token[model] = len(prompt) / stats["prompt_eval_count"]
+        discarded = max(0, decoded - useful)
+        metrics.increment("tokens.decoded", decoded)
+        metrics.increment("tokens.discarded", discarded)
+        record = {
+            "model": model,
+            "action_type": action_type,
+            "num_predict": stats.get("options", {}).get("num_predict"),
+            "num_ctx": stats.get("options", {}).get("num_ctx"),
+            "decoded": decoded,
+            "useful": useful,
+            "discarded": discarded,
+        }
+        self.turn_log.append(record)
+        del self.turn_log[:-CONFIG["ADAPTIVE_WINDOW"]]
+        return record
+
+
+class OpeningPool:
+    """
+    Pre-narrated opening scenes per (genre, role, model), generated by a
+    background-priority worker while no interactive request is running.
+    Combinations are kept warm by how often games start with them
+    """
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or Path(CONFIG["CACHE_DIR"]) / "openings.json")
+        self._lock = threading.Lock()
+        self._combos: Optional[Dict[str, Dict[str, Any]]] = None
+        self._worker: Optional[threading.Thread] = None
+        self._wanted: List[str] = []  # combos requested this session, refilled first
+        self._dirty = False  # start counts changed since the last save
+    
+    @staticmethod
+    def key(genre: str, role: str, model: str) -> str:
+        return f"{genre}|{role}|{model}"
+    
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Pool contents, read from disk on first use (caller holds the lock)"""
+        if self._combos is None:
+            self._combos = {}
+            if self.path.exists():
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._combos = json.load(f).get("combos", {})
+                except (OSError, json.JSONDecodeError):
+                    pass
+        return self._combos
+    
+    def _save(self):
+        """Persist the pool (caller holds the lock); on failure it stays dirty and in memory"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"combos": self._combos}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            metrics.increment("openings.save_failures")
+            console.print(f"[yellow]⚠ Could not save the opening pool to {self.path}: {e}[/yellow]")
+            return
+        self._dirty = False
+    
+    def flush(self):
+        """Persist start counts and dropped openings not yet on disk"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+    
+    def _fresh(self, combo: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Drop openings older than OPENING_POOL_MAX_AGE (caller holds the lock)"""
+        cutoff = time.time() - CONFIG["OPENING_POOL_MAX_AGE"]
+        fresh = [opening for opening in combo["openings"] if opening["created"] >= cutoff]
+        if len(fresh) < len(combo["openings"]):
+            metrics.increment("openings.stale", len(combo["openings"]) - len(fresh))
+            combo["openings"] = fresh
+        return fresh
+    
+    def pop(self, genre: str, role: str, model: str) -> Optional[str]:
+        """Take a ready opening for a new game (None on a miss) and refill in the background"""
+        if CONFIG["OPENING_POOL_SIZE"] <= 0:
+            return None
+        key = self.key(genre, role, model)
+        with self._lock:
+            combo = self._load().setdefault(key, {"starts": 0, "openings": []})
+            combo["starts"] += 1
+            fresh = self._fresh(combo)
+            opening = fresh.pop(0)["text"] if fresh else None
+            if key not in self._wanted:
+                self._wanted.append(key)
+            self._dirty = True
+        metrics.increment("openings.hits" if opening else "openings.misses")
+        hits = metrics.get_counter("openings.hits")
+        metrics.set_gauge("openings.hit_rate", round(hits / (hits + metrics.get_counter("openings.misses")), 3))
+        self.refill()
+        return opening
+    
+    def _next_target(self) -> Optional[str]:
+        """Combo most in need of another opening: this session's first, then the most started"""
+        with self._lock:
+            combos = self._load()
+            popular = sorted(combos, key=lambda key: -combos[key]["starts"])[:CONFIG["OPENING_POOL_COMBOS"]]
+            for key in self._wanted + popular:
+                if key in combos and len(self._fresh(combos[key])) < CONFIG["OPENING_POOL_SIZE"]:
+                    return key
+        return None
+    
+    def refill(self):
+        """Start the background worker unless it is already running"""
+        if CONFIG["OPENING_POOL_SIZE"] <= 0:
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._fill, daemon=True)
+            self._worker.start()
+    
+    def _fill(self):
+        """Generate openings one at a time until every target combo is full"""
+        failures = 0
+        while failures < 3:
+            key = self._next_target()
+            if key is None:
+                return
+            # Only use the server while no player is waiting on it
+            scheduler.wait_idle("interactive")
+            genre, role, model = key.split("|", 2)
+            try:
+                text = self.generate(genre, role, model)
+            except RuntimeError:
+                metrics.increment("openings.failures")
+                failures += 1
+                continue
+            with self._lock:
+                combo = self._load().setdefault(key, {"starts": 0, "openings": []})
+                combo["openings"].append({"text": text, "created": time.time()})
+                self._save()
+            metrics.increment("openings.generated")
+    
+    @staticmethod
+    def generate(genre: str, role: str, model: str) -> str:
+        """Narrate one opening scene at background priority"""
+        opener = ROLE_STARTERS.get(genre, {}).get(role, "The atmosphere hangs with possibility when")
+        prompt = OPENING_SCENE_PROMPT.format(
+            system=DM_SYSTEM_PROMPT.strip(),
+            genre=genre,
+            setting=GENRE_DESCRIPTIONS.get(genre, ""),
+            role=role,
+            opener=opener
+        )
+        text = OllamaAPI.generate(model, prompt, use_cache=False, session_id="opening-pool", priority="background")
+        if not text:
+            raise RuntimeError("Empty opening scene")
+        return text
+
+
+opening_pool = OpeningPool()
+
+
+class ActionSuggester:
+    """
+    Suggested next actions, computed off the critical path
+    A background-priority generation starts once a world response is shown. It
+    reuses the turn's prompt prefix and model (so Ollama keeps the evaluated
+    context) and is cancelled when the player submits input: a request still
+    waiting for a slot is withdrawn, and a streaming one has its connection shut
+    down at once, so Ollama stops generating and the slot is free for the turn.
+    Finished suggestions are handed to notify (which prints them above the
+    prompt) and can be picked by number
+    """
+    def __init__(self, session_id: str, notify: Callable[[str], None]):
+        self.session_id = session_id
+        self.notify = notify
+        self.shown: List[str] = []
+        self.cancelled = CancelToken()
+        self.lock = threading.Lock()  # nothing is printed once cancel() has returned
+        self.thread: Optional[threading.Thread] = None
+    
+    @staticmethod
+    def parse(text: str, count: int) -> List[str]:
+        """Specific, distinct actions from the model's one-per-line answer"""
+        suggestions = []
+        for line in text.splitlines():
+            match = SUGGESTION_LINE_PATTERN.match(line)
+            if not match:
+                continue
+            suggestion = (match.group(2) or match.group(3)).strip()
+            if len(suggestion.split()) < 2 or suggestion.upper().startswith("SUGGEST"):
+                continue
+            if suggestion.lower() not in (s.lower() for s in suggestions):
+                suggestions.append(suggestion)
+            if len(suggestions) == count:
+                break
+        return suggestions
+    
+    def start(self, model: str, prefix: str, action: str, response: str, num_ctx: int):
+        """Cancel any running request and suggest actions for the latest response"""
+        count = CONFIG["SUGGESTION_COUNT"]
+        self.cancel()
+        self.shown = []
+        if not count:
+            return
+        cancelled = CancelToken()
+        self.cancelled = cancelled
+        prompt = prefix + SUGGESTION_PROMPT.format(action=action, response=response, count=count)
+        options = {
+            "stop": SUGGESTION_STOP_TOKENS,
+            "num_predict": 30 * count,
+            "num_ctx": num_ctx,  # a different context size would reload the model
+            "temperature": 0.9,
+        }
+        def run():
+            start = time.perf_counter()
+            try:
+                text = OllamaAPI.generate(model, prompt, options, use_cache=False, session_id=self.session_id,
+                                          priority="background", postprocess_steps=[], cancel=cancelled)
+            except GenerationCancelled:
+                metrics.increment("suggestions.cancelled")
+                return
+            except RuntimeError:
+                metrics.increment("suggestions.failures")
+                return
+            suggestions = self.parse(text, count)
+            if not suggestions:
+                metrics.increment("suggestions.failures")
+                return
+            with self.lock:
+                if cancelled.is_set():
+                    metrics.increment("suggestions.cancelled")
+                    return
+                self.shown = suggestions
+                self.notify("\n".join(
+                    f"[dim]💡 [cyan]{idx}[/cyan] {escape(suggestion)}[/dim]"
+                    for idx, suggestion in enumerate(suggestions, 1)
+                ))
+            metrics.increment("suggestions.generated")
+            metrics.record_time("suggestions.latency", time.perf_counter() - start)
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+    
+    def cancel(self):
+        """Stop the pending request; suggestions already shown stay pickable"""
+        with self.lock:
+            self.cancelled.set()
+    
+    def pick(self, choice: str) -> Optional[str]:
+        """The suggestion a numeric input refers to, if any"""
+        if choice.isdigit() and 1 <= int(choice) <= len(self.shown):
+            metrics.increment("suggestions.picked")
+            return self.shown[int(choice) - 1]
+        return None
+
+
+@dataclass
+class TurnEvent:
+    """Something that happened to a session, delivered to post-turn handlers"""
+    name: str
+    game: Any  # the GameManager that published it
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class TurnEventBus:
+    """
+    Post-turn hooks, run off the critical path
+    Handlers subscribe to an event name and run on a small worker pool, so the
+    next prompt comes back as soon as the response is shown. Events of one
+    session are handled one at a time in publish order; sessions are handled
+    in parallel. A failing handler is counted in metrics and does not affect
+    the turn or the other handlers. Each handler is timed as
+    events.<event>.<handler>
+    """
+    EVENTS = ("turn_completed", "redo", "save", "load")
+    
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or CONFIG["EVENT_WORKERS"]
+        self._handlers: Dict[str, List[Callable[[TurnEvent], None]]] = {name: [] for name in self.EVENTS}
+        self._pending: Dict[str, deque] = {}  # session id -> events waiting for its worker
+        self._cond = threading.Condition()
+        self._pool: Optional[ThreadPoolExecutor] = None
+    
+    def subscribe(self, name: str, handler: Callable[[TurnEvent], None]):
+        """Run handler(event) for every event with this name"""
+        if name not in self._handlers:
+            raise ValueError(f"Unknown event '{name}'")
+        self._handlers[name].append(handler)
+    
+    def publish(self, name: str, game: Any, **data: Any):
+        """Queue an event for the game's session; returns immediately"""
+        if name not in self._handlers:
+            raise ValueError(f"Unknown event '{name}'")
+        if not self._handlers[name]:
+            return
+        metrics.increment(f"events.{name}")
+        event = TurnEvent(name, game, data)
+        session_id = game.session_id
+        with self._cond:
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                # A worker is already draining this session and will pick it up in order
+                pending.append(event)
+                return
+            self._pending[session_id] = deque([event])
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="turn-events")
+        self._pool.submit(self._drain, session_id)
+    
+    def _drain(self, session_id: str):
+        """Handle a session's events until its queue is empty"""
+        while True:
+            with self._cond:
+                pending = self._pending[session_id]
+                if not pending:
+                    del self._pending[session_id]
+                    self._cond.notify_all()
+                    return
+                event = pending[0]
+            for handler in list(self._handlers[event.name]):
+                start = time.perf_counter()
+                try:
+                    handler(event)
+                except Exception as e:
+                    metrics.increment(f"events.failures.{handler.__qualname__}")
+                    message = f"[yellow]⚠ {handler.__qualname__} failed on {event.name}: {escape(str(e))}[/yellow]"
+                    # Headless games drop notices, so their failures go straight to the console
+                    if event.game.quiet:
+                        console.print(message)
+                    else:
+                        event.game.notify(message)
+                metrics.record_time(f"events.{event.name}.{handler.__qualname__}", time.perf_counter() - start)
+            with self._cond:
+                pending.popleft()
+    
+    def flush(self, session_id: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Wait until a session's (or every session's) events are handled; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: session_id not in self._pending if session_id is not None else not self._pending,
+                timeout
+            )
+
+
+events = TurnEventBus()
+
+
+class StreamingRenderer:
+    """Paints a streamed response with Rich Live, then swaps in the final Markdown render"""
+    def __init__(self, status: str, steps: Optional[List[str]] = None):
+        self.status = status
+        self.processor = ResponsePostProcessor.stream(steps)
+        self.last_refresh = 0.0
+        self.live = Live(
+            Spinner("dots", text=Text(status, style="bold cyan")),
+            console=console,
+            auto_refresh=False,
+            transient=True
+        )
+    
+    def __enter__(self) -> "StreamingRenderer":
+        console.print(f"\n[bold cyan]🌍 World Response 🌍[/bold cyan]")
+        self.live.start(refresh=True)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.live.stop()
+        return False
+    
+    def preview(self) -> str:
+        """Cleaned-up sentences so far plus the sentence still arriving"""
+        pending = self.processor.pending()
+        return f"{self.processor.text} {pending}".strip()
+    
+    def feed(self, token: str):
+        """Receive a streamed chunk; refreshes at most STREAM_REFRESH_PER_SECOND times"""
+        if self.processor.done:
+            return
+        self.processor.feed(token)
+        now = time.perf_counter()
+        if now - self.last_refresh >= 1.0 / CONFIG["STREAM_REFRESH_PER_SECOND"]:
+            self.last_refresh = now
+            self.live.update(Text(self.preview()), refresh=True)
+    
+    def finish(self, text: str):
+        """Replace the live preview with the final Markdown render"""
+        self.live.stop()
+        console.print(Markdown(text))
+        console.print()
+
+
 class AdventureUI:
     """User Interface handler using Rich"""
     @staticmethod
@@ -569,11 +2619,15 @@ class AdventureUI:
         commands = [
             ("/quit, /exit", "Exit the game"),
             ("/restart", "Start a new game"),
-            ("/save", "Save current game state (JSON)"),
+            ("/save", "Save current game state"),
             ("/load", "Load saved game"),
             ("/export_txt", "Export adventure as text file"),
+            ("/export [txt|md|html|jsonl]", "Export adventure (appends new turns to the last export)"),
             ("/history", "Show recent history"),
             ("/stats", "Show game statistics"),
+            ("/metrics", "Show latency and usage metrics"),
+            ("/world", "Show tracked location, inventory, NPCs and threats"),
+            ("/prompt [text]", "Show the last prompt's size by section and adventure totals"),
             ("/redo", "🔄 Redo last action with NEW consequences"),
             ("/help", "Show this help")
         ]
@@ -617,6 +2671,7 @@ class AdventureUI:
             f"[bold]Role:[/bold] {state.role}\n"
             f"[bold]Player:[/bold] {state.player_name}\n"
             f"[bold]Model:[/bold] {state.model}\n"
+            f"[bold]Fast Model:[/bold] {state.fast_model or 'none'}\n"
             f"[bold]Duration:[/bold] {state.get_session_duration()}\n"
             f"[bold]Actions:[/bold] {state.get_message_count() // 2}",
             title="Game Info",
@@ -631,6 +2686,11 @@ class AdventureUI:
         console.print(Markdown(text))
         console.print()
     
+    @staticmethod
+    def stream_world_response(status: str, steps: Optional[List[str]] = None) -> StreamingRenderer:
+        """Live renderer for a response that is still being generated"""
+        return StreamingRenderer(status, steps)
+    
     @staticmethod
     def show_error(message: str):
         """Display error message"""
@@ -656,6 +2716,9 @@ class AdventureUI:
 
 class AdventureExporter:
     """Handles exporting adventures to various formats"""
+    FORMATS = ("txt", "md", "html", "jsonl")
+    INDEX_FILE = ".export_index.json"
+    
     @staticmethod
     def ensure_directories():
         """Create necessary directories if they don't exist"""
@@ -663,88 +2726,267 @@ class AdventureExporter:
             Path(directory).mkdir(parents=True, exist_ok=True)
     
     @staticmethod
-    def export_to_txt(state: GameState, filename: Optional[str] = None) -> str:
+    def iter_turns(history: List[Dict[str, str]], start: int = 0,
+                   complete_only: bool = False) -> Iterator[Tuple[int, int, str, str]]:
         """
-        Export adventure to a readable text file
-        Returns: Path to the exported file
+        Pair player messages with the DM response that follows them
+        Yields (start_index, end_index, player_text, world_text); with complete_only
+        a trailing action that has no response yet is not yielded
         """
-        AdventureExporter.ensure_directories()
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_name = "".join(c for c in state.player_name if c.isalnum() or c in (' ', '-', '_'))
-            filename = f"{safe_name}_{state.genre}_{timestamp}.txt"
-        # Ensure .txt extension
-        if not filename.endswith('.txt'):
-            filename += '.txt'
-        filepath = Path(CONFIG["EXPORT_DIR"]) / filename
+        i = start
+        while i < len(history):
+            if history[i]["role"] != "user":
+                # Skip any non-user messages
+                i += 1
+                continue
+            begin = i
+            player_text = history[i]["content"]
+            world_text = ""
+            if i + 1 < len(history) and history[i + 1]["role"] == "assistant":
+                world_text = history[i + 1]["content"]
+                i += 2
+            else:
+                if complete_only and i + 1 >= len(history):
+                    return
+                i += 1
+            yield begin, i, player_text, world_text
+    
+    @staticmethod
+    def session_key(state: GameState) -> str:
+        """Stable identifier of a session across exports"""
+        material = f"{state.player_name}|{state.genre}|{state.role}|{state.start_time.isoformat() if state.start_time else ''}"
+        return hashlib.sha1(material.encode("utf-8")).hexdigest()[:16]
+    
+    @staticmethod
+    def turn_digest(player_text: str, world_text: str) -> str:
+        """Fingerprint of an exported turn, used to detect /redo since the last export"""
+        return hashlib.sha1(f"{player_text}\x00{world_text}".encode("utf-8")).hexdigest()
+    
+    # Format writers: header, one turn, footer
+    @staticmethod
+    def format_header(state: GameState, fmt: str) -> str:
+        """Metadata and opening scene"""
+        opener = state.opening_scene()
+        started = state.start_time.strftime('%Y-%m-%d %H:%M:%S') if state.start_time else ""
+        if fmt == "txt":
+            header = "=" * 80 + "\n" + "ADVENTURE LOG\n" + "=" * 80 + "\n"
+            header += "METADATA\n" + "-" * 40 + "\n"
+            header += f"Player: {state.player_name}\nRole: {state.role}\nGenre: {state.genre}\nModel: {state.model}\n"
+            if started:
+                header += f"Started: {started}\n"
+            header += "\n"
+            header += "OPENING SCENE\n" + "-" * 40 + "\n" + f"{opener}\n"
+            header += "ADVENTURE HISTORY\n" + "-" * 40 + "\n"
+            return header
+        if fmt == "md":
+            return (
+                f"# Adventure Log: {state.player_name}\n\n"
+                f"- **Role:** {state.role}\n- **Genre:** {state.genre}\n- **Model:** {state.model}\n"
+                f"- **Started:** {started}\n\n"
+                f"## Opening Scene\n\n*{opener}*\n\n## Adventure History\n"
+            )
+        if fmt == "html":
+            return (
+                "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                f"<title>Adventure Log: {html.escape(state.player_name)}</title>\n</head>\n<body>\n"
+                f"<h1>Adventure Log: {html.escape(state.player_name)}</h1>\n<ul>\n"
+                f"<li><b>Role:</b> {html.escape(state.role)}</li>\n<li><b>Genre:</b> {html.escape(state.genre)}</li>\n"
+                f"<li><b>Model:</b> {html.escape(state.model)}</li>\n<li><b>Started:</b> {started}</li>\n</ul>\n"
+                f"<h2>Opening Scene</h2>\n<p><i>{html.escape(opener)}</i></p>\n<h2>Adventure History</h2>\n"
+            )
+        return json.dumps({
+            "type": "metadata",
+            "player": state.player_name,
+            "role": state.role,
+            "genre": state.genre,
+            "model": state.model,
+            "started": state.start_time.isoformat() if state.start_time else None,
+            "opening": opener,
+        }, ensure_ascii=False) + "\n"
+    
+    @staticmethod
+    def format_turn(action_number: int, player_text: str, world_text: str, fmt: str) -> str:
+        """One player action and the world response"""
+        if fmt == "txt":
+            text = f"\nACTION #{action_number}\n" + "~" * 40 + "\n" + f"[PLAYER]  {player_text}\n"
+            if world_text:
+                text += f"[WORLD]   {world_text}\n"
+            return text
+        if fmt == "md":
+            text = f"\n### Action {action_number}\n\n**Player:** {player_text}\n"
+            if world_text:
+                text += f"\n**World:** {world_text}\n"
+            return text
+        if fmt == "html":
+            text = f"<h3>Action {action_number}</h3>\n<p><b>Player:</b> {html.escape(player_text)}</p>\n"
+            if world_text:
+                text += f"<p><b>World:</b> {html.escape(world_text)}</p>\n"
+            return text
+        return json.dumps({"type": "turn", "action": action_number, "player": player_text,
+                           "world": world_text}, ensure_ascii=False) + "\n"
+    
+    @staticmethod
+    def format_footer(state: GameState, total_actions: int, fmt: str) -> str:
+        """Closing lines, including the running totals; rewritten on every incremental export"""
+        exported = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if fmt == "txt":
+            return ("\n" + "=" * 80 + "\n" + "End of adventure log\n" +
+                    f"Total Actions: {total_actions}\n" +
+                    f"Session Duration: {state.get_session_duration()}\n" +
+                    f"Exported: {exported}\n" + "=" * 80 + "\n")
+        if fmt == "md":
+            return f"\n---\n*End of adventure log: {total_actions} actions, exported {exported}*\n"
+        if fmt == "html":
+            return f"<hr>\n<p><i>End of adventure log: {total_actions} actions, exported {exported}</i></p>\n</body>\n</html>\n"
+        return ""
+    
+    @classmethod
+    def _load_index(cls) -> Dict[str, Dict[str, Any]]:
+        """Where each session's incremental exports stopped"""
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                # Write header
-                f.write("=" * 80 + "\n")
-                f.write("ADVENTURE LOG\n")
-                f.write("=" * 80 + "\n")
-                # Metadata
-                f.write("METADATA\n")
-                f.write("-" * 40 + "\n")
-                f.write(f"Player: {state.player_name}\n")
-                f.write(f"Role: {state.role}\n")
-                f.write(f"Genre: {state.genre}\n")
-                f.write(f"Model: {state.model}\n")
-                if state.start_time:
-                    f.write(f"Started: {state.start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Session Duration: {state.get_session_duration()}\n")
-                f.write(f"Total Actions: {state.get_message_count() // 2}\n")
-                f.write("\n")
-                # Opening scene
-                opener = ROLE_STARTERS.get(state.genre, {}).get(state.role,
-                    "The atmosphere hangs with possibility when")
-                f.write("OPENING SCENE\n")
-                f.write("-" * 40 + "\n")
-                f.write(f"{opener}...\n")
-                # Adventure history
-                f.write("ADVENTURE HISTORY\n")
-                f.write("-" * 40 + "\n")
-                # Group messages by action
-                action_number = 1
-                i = 0
-                while i < len(state.history):
-                    # Look for player message
-                    if i < len(state.history) and state.history[i]["role"] == "user":
-                        player_msg = state.history[i]
-                        # Look for corresponding DM response
-                        dm_response = ""
-                        if i + 1 < len(state.history) and state.history[i + 1]["role"] == "assistant":
-                            dm_response = state.history[i + 1]["content"]
-                            i += 2
-                        else:
-                            i += 1
-                        # Write action
-                        f.write(f"\nACTION #{action_number}\n")
-                        f.write("~" * 40 + "\n")
-                        f.write(f"[PLAYER]  {player_msg['content']}\n")
-                        if dm_response:
-                            f.write(f"[WORLD]   {dm_response}\n")
-                        action_number += 1
+            with open(Path(CONFIG["EXPORT_DIR"]) / cls.INDEX_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+    
+    @classmethod
+    def _save_index(cls, index: Dict[str, Dict[str, Any]]):
+        """Atomically persist the export index"""
+        path = Path(CONFIG["EXPORT_DIR"]) / cls.INDEX_FILE
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def previous_export(cls, state: GameState, fmt: str) -> Optional[str]:
+        """Path of the last incremental export of this session in this format"""
+        entry = cls._load_index().get(f"{cls.session_key(state)}:{fmt}")
+        if entry and Path(entry["path"]).exists():
+            return entry["path"]
+        return None
+    
+    @classmethod
+    def export(cls, state: GameState, fmt: str = "txt", filename: Optional[str] = None,
+               incremental: bool = True, fresh: bool = False) -> str:
+        """
+        Stream the adventure to a file in the given format
+        Incremental exports reopen the file of the previous export of this session,
+        cut off its footer and append only the turns added since then; fresh
+        writes the whole adventure and makes the new file the one later exports append to
+        Returns: Path to the exported file
+        """
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(cls.FORMATS)}")
+        cls.ensure_directories()
+        index_key = f"{cls.session_key(state)}:{fmt}"
+        index = cls._load_index() if incremental else {}
+        entry = None if fresh else index.get(index_key)
+        if entry and filename is None:
+            filepath = Path(entry["path"])
+        else:
+            if filename is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                safe_name = "".join(c for c in state.player_name if c.isalnum() or c in (' ', '-', '_'))
+                filename = f"{safe_name}_{state.genre}_{timestamp}"
+            if not filename.endswith(f".{fmt}"):
+                filename += f".{fmt}"
+            filepath = Path(CONFIG["EXPORT_DIR"]) / filename
+            if entry and str(filepath) != entry["path"]:
+                entry = None
+        history = state.history
+        # The previous export is reusable if its last turn is unchanged (e.g. no /redo since)
+        resume = None
+        if entry and filepath.exists() and entry["message_index"] <= len(history):
+            resume = entry
+            last = entry.get("last_turn")
+            if last:
+                current = next(cls.iter_turns(history, last["start"]), None)
+                if current is None or current[0] != last["start"] or \
+                        cls.turn_digest(current[2], current[3]) != last["digest"]:
+                    if last["start"] > len(history):
+                        resume = None
                     else:
-                        # Skip any non-user messages
-                        i += 1
-                # Footer
-                f.write("\n" + "=" * 80 + "\n")
-                f.write(f"End of adventure log\n")
-                f.write(f"Exported: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write("=" * 80 + "\n")
+                        # Rewrite only the changed last turn
+                        resume = {**entry, "message_index": last["start"],
+                                  "action_number": entry["action_number"] - 1,
+                                  "footer_offset": last["offset"], "last_turn": None}
+        try:
+            if resume:
+                f = open(filepath, 'r+b')
+                f.seek(resume["footer_offset"])
+                f.truncate()
+                message_index = resume["message_index"]
+                action_number = resume["action_number"]
+                last_turn = resume.get("last_turn")
+            else:
+                f = open(filepath, 'wb')
+                f.write(cls.format_header(state, fmt).encode("utf-8"))
+                message_index, action_number, last_turn = 0, 0, None
+            with f:
+                for start, end, player_text, world_text in cls.iter_turns(
+                        history, message_index, complete_only=incremental):
+                    action_number += 1
+                    last_turn = {"start": start, "offset": f.tell(),
+                                 "digest": cls.turn_digest(player_text, world_text)}
+                    f.write(cls.format_turn(action_number, player_text, world_text, fmt).encode("utf-8"))
+                    message_index = end
+                footer_offset = f.tell()
+                f.write(cls.format_footer(state, action_number, fmt).encode("utf-8"))
+            if incremental:
+                index[index_key] = {
+                    "path": str(filepath),
+                    "message_index": message_index,
+                    "action_number": action_number,
+                    "footer_offset": footer_offset,
+                    "last_turn": last_turn,
+                }
+                cls._save_index(index)
             return str(filepath)
         except Exception as e:
             raise RuntimeError(f"Failed to export adventure: {e}")
+    
+    @classmethod
+    def export_to_txt(cls, state: GameState, filename: Optional[str] = None) -> str:
+        """
+        Export adventure to a readable text file
+        Returns: Path to the exported file
+        """
+        return cls.export(state, "txt", filename, incremental=False)
 
 
 class GameManager:
     """Main game manager"""
-    def __init__(self):
+    def __init__(self, quiet: bool = False, session_id: Optional[str] = None,
+                 prompt_variant: Optional[str] = None):
         self.state: Optional[GameState] = None
+        self.quiet = quiet
+        self.prompt_variant = prompt_variant or CONFIG["PROMPT_VARIANT"]
+        self.session_id = session_id or uuid.uuid4().hex[:12]
         self.ui = AdventureUI()
         self.exporter = AdventureExporter()
         self.analyzer = ActionAnalyzer()
+        self.router = ModelRouter()
+        self.tuner = GenerationTuner()
+        self.last_analysis: Optional[Dict[str, Any]] = None
+        self.last_stats: Dict[str, Any] = {}
+        self.world_before_turn: Optional[WorldState] = None
+        self.world_lock = threading.Lock()  # serializes turn updates and background merges
+        self.world_pass: Optional[threading.Thread] = None
+        self.memory: Optional[SemanticMemory] = None
+        self.memory_source: Optional[Path] = None  # save whose index is loaded on first use
+        self.memory_synced = False
+        self.last_prompt_sections: List[Tuple[str, str]] = []
+        self.last_prompt_model: Optional[str] = None
+        self.stream_steps: Optional[List[str]] = None  # post-processing of the live preview
+        self.suggester = ActionSuggester(self.session_id, self.notify)
+        self.suggest_actions = not quiet
+        # Notices from background work, shown without garbling the prompt
+        self.notice_lock = threading.Lock()
+        self.notices: List[str] = []
+        self.prompt_label: Optional[str] = None  # set while waiting for input
+        # Verbs and objects used so far: counted over the first "messages" messages of "source"
+        self.turn_stats: Dict[str, Any] = {"source": None, "messages": 0, "verbs": set(), "objects": set()}
     
     def setup_game(self) -> bool:
         """Setup new game, returns True if setup successful"""
@@ -763,6 +3005,8 @@ class GameManager:
                     console.print("  [cyan]ollama pull  HammerAI/mn-mag-mell-r1[/cyan]")
                     return False
                 console.print(f"[green]✅ Found {len(models)} models[/green]")
+                # Top up pre-narrated openings for popular games while the player sets up
+                opening_pool.refill()
         except RuntimeError as e:
             self.ui.show_error(str(e))
             console.print("\n[yellow]Make sure Ollama is running:[/yellow]")
@@ -770,6 +3014,14 @@ class GameManager:
             return False
         # Model selection
         model = self.ui.choose_option("Select Model", models)
+        fast_model = CONFIG["FAST_MODEL"]
+        if fast_model is None and len(models) > 1:
+            same_option = "Same as main model"
+            fast_choice = self.ui.choose_option(
+                "Select Fast Model (routine actions)",
+                [same_option] + [m for m in models if m != model]
+            )
+            fast_model = None if fast_choice == same_option else fast_choice
         # Character setup
         console.print("\n[bold cyan]🧙 Character Creation 🧙[/bold cyan]")
         player_name = Prompt.ask("[cyan]Character name[/cyan]", default="Adventurer")
@@ -791,23 +3043,30 @@ class GameManager:
             player_name=player_name,
             genre=genre,
             role=role,
-            history=[]
+            history=PagedHistory(),
+            fast_model=fast_model,
+            opening=opening_pool.pop(genre, role, model) or ""
         )
+        self.reset_turn_state()
         return True
     
-    def build_prompt(self, user_action: str) -> str:
-        """Build the prompt for the model with action analysis"""
-        if not self.state:
-            raise ValueError("Game state not initialized")
-        # Analyze the action
-        action_analysis = self.analyzer.analyze_action(user_action, self.state.genre, self.state.role)
-        action_context = self.analyzer.build_action_context(action_analysis, self.state.genre, self.state.role)
-        # Show analysis (for debugging/transparency)
-        self.ui.show_action_analysis(action_analysis)
-        # Start with system prompt
-        system_context = (
-            DM_SYSTEM_PROMPT.strip() + "\n" +
-            ACTION_ANALYSIS_PROMPT.strip() + "\n" +
+    def reset_turn_state(self):
+        """Forget the previous game's last turn (redo checkpoint, prompt, stats) when another one starts"""
+        self.last_analysis = None
+        self.last_stats = {}
+        self.world_before_turn = None
+        self.last_prompt_sections = []
+        self.last_prompt_model = None
+        self.suggester.cancel()
+        self.suggester.shown = []
+    
+    def full_instruction_sections(self, action_analysis: Dict[str, Any], action_context: str) -> List[Tuple[str, str]]:
+        """Original instruction set: system prompt, analysis rules, context and response requirements"""
+        sections: List[Tuple[str, str]] = [
+            ("instructions", f"SYSTEM INSTRUCTIONS:\n{DM_SYSTEM_PROMPT.strip()}\n"),
+            ("analysis_rules", ACTION_ANALYSIS_PROMPT.strip() + "\n"),
+        ]
+        context = (
             f"CONTEXT:\n" +
             f"- Genre: {self.state.genre}\n" +
             f"- Character: {self.state.player_name} as {self.state.role}\n" +
@@ -816,41 +3075,276 @@ class GameManager:
             f"- Success Likelihood: {action_analysis['success_likelihood'].upper()}\n"
         )
         if action_context:
-            system_context += f"- Additional Context: {action_context}\n"
-        system_context += "\nCURRENT ACTION ANALYSIS:\n"
+            context += f"- Additional Context: {action_context}\n"
+        context += "\nCURRENT ACTION ANALYSIS:\n"
         if action_analysis['verbs']:
-            system_context += f"- Key Verbs: {', '.join(action_analysis['verbs'])}\n"
+            context += f"- Key Verbs: {', '.join(action_analysis['verbs'])}\n"
         if action_analysis['objects']:
-            system_context += f"- Key Objects: {', '.join(action_analysis['objects'])}\n"
-        system_context += "\nRESPONSE REQUIREMENTS:\n"
-        system_context += "1. EVERY sentence must directly relate to the player's SPECIFIC action\n"
-        system_context += "2. Show PHYSICAL/LOGICAL consequences (not just 'you try')\n"
-        system_context += "3. NO unrelated events or characters appearing out of nowhere\n"
-        system_context += "4. 2-4 sentences MAXIMUM\n"
-        system_context += "5. START with the direct consequence of the action\n"
-        system_context += "6. Use ACTIVE voice to emphasize player agency\n"
-        # Check if this is the first action
-        if len(self.state.history) == 0:
-            opener = ROLE_STARTERS.get(self.state.genre, {}).get(self.state.role,
-                "The atmosphere hangs with possibility when")
-            system_context += f"\nSCENE START: {opener}...\n"
+            context += f"- Key Objects: {', '.join(action_analysis['objects'])}\n"
+        sections.append(("context", context))
+        requirements = "\nRESPONSE REQUIREMENTS:\n"
+        requirements += "1. EVERY sentence must directly relate to the player's SPECIFIC action\n"
+        requirements += "2. Show PHYSICAL/LOGICAL consequences (not just 'you try')\n"
+        requirements += "3. NO unrelated events or characters appearing out of nowhere\n"
+        requirements += "4. 2-4 sentences MAXIMUM\n"
+        requirements += "5. START with the direct consequence of the action\n"
+        requirements += "6. Use ACTIVE voice to emphasize player agency\n"
+        sections.append(("requirements", requirements))
+        return sections
+    
+    def compact_instruction_sections(self, action_analysis: Dict[str, Any], action_context: str) -> List[Tuple[str, str]]:
+        """Deduplicated instruction set: each rule stated once, context on two lines"""
+        context = (
+            f"CONTEXT: {self.state.genre} | {self.state.player_name} as {self.state.role} | "
+            f"{action_analysis['type']} action, {action_analysis['intensity']} intensity, "
+            f"success {action_analysis['success_likelihood']}\n"
+        )
+        details = [f"{label}: {', '.join(values)}" for label, values in
+                   (("verbs", action_analysis['verbs']), ("objects", action_analysis['objects'])) if values]
+        if action_context:
+            details.insert(0, action_context)
+        if details:
+            context += f"NOTES: {' | '.join(details)}\n"
+        return [
+            ("instructions", f"SYSTEM INSTRUCTIONS:\n{COMPACT_SYSTEM_PROMPT.strip()}\n"),
+            ("context", context),
+        ]
+    
+    def history_sections(self, query: str) -> List[Tuple[str, str]]:
+        """World state, related memories and recent history; query is what memories are matched against"""
+        sections: List[Tuple[str, str]] = []
+        # The structured world state stands in for older transcript turns
+        history_messages = 8  # Keep last 4 actions (player + DM pairs)
+        if CONFIG["USE_WORLD_STATE"] and not self.state.world.is_empty():
+            sections.append(("world_state", f"{self.state.world.to_prompt()}\n"))
+            history_messages = CONFIG["WORLD_STATE_HISTORY_MESSAGES"]
+        # Older turns that are semantically related to this action
+        memory_text = ""
+        memory = self.get_memory()
+        if memory is not None and len(memory):
+            try:
+                matches = memory.search(query, CONFIG["MEMORY_TOP_K"],
+                                        before_index=len(self.state.history) - history_messages)
+            except RuntimeError:
+                matches = []
+            for message_index, _ in sorted(matches):
+                player_msg = self.state.history[message_index]
+                world_msg = self.state.history[message_index + 1] if message_index + 1 < len(self.state.history) else None
+                memory_text += f"EARLIER ACTION: {player_msg['content']}\n"
+                if world_msg and world_msg["role"] == "assistant":
+                    memory_text += f"EARLIER RESULT: {world_msg['content']}\n"
+        if memory_text:
+            sections.append(("memories", f"RELEVANT MEMORIES:\n{memory_text}\n"))
         # Build history (last 3-4 actions for context)
         history_text = ""
-        recent_history = self.state.history[-8:]  # Keep last 4 actions (player + DM pairs)
+        recent_history = self.state.history[-history_messages:]
         for msg in recent_history:
             if msg["role"] == "user":
                 history_text += f"PREVIOUS ACTION: {msg['content']}\n"
             elif msg["role"] == "assistant":
                 history_text += f"RESULT: {msg['content']}\n"
-        # Current action
-        current_action = f"CURRENT ACTION: {user_action}\n"
-        # Combine everything
-        full_prompt = f"SYSTEM INSTRUCTIONS:\n{system_context}\n"
         if history_text:
-            full_prompt += f"RECENT HISTORY:\n{history_text}\n"
-        full_prompt += f"\n{current_action}\n"
-        full_prompt += "NARRATE IMMEDIATE CONSEQUENCES (2-4 sentences, consequence-first):\n"
-        return full_prompt
+            sections.append(("history", f"RECENT HISTORY:\n{history_text}\n"))
+        return sections
+    
+    def build_prompt(self, user_action: str) -> str:
+        """Build the prompt for the model with action analysis"""
+        if not self.state:
+            raise ValueError("Game state not initialized")
+        # Analyze the action
+        action_analysis = self.analyzer.analyze_action(user_action, self.state.genre, self.state.role)
+        action_context = self.analyzer.build_action_context(action_analysis, self.state.genre, self.state.role)
+        self.last_analysis = action_analysis
+        # Show analysis (for debugging/transparency)
+        if not self.quiet:
+            self.ui.show_action_analysis(action_analysis)
+        # The prompt is assembled from named sections so its size can be accounted for
+        if self.prompt_variant == "compact":
+            sections = self.compact_instruction_sections(action_analysis, action_context)
+        else:
+            sections = self.full_instruction_sections(action_analysis, action_context)
+        # A pooled opening the player has just read is given to the model on the first
+        # turn (the action is already in the history at this point); without one the
+        # prompt is unchanged
+        if len(self.state.history) <= 1 and self.state.opening:
+            sections.append(("scene_start", f"\nSCENE START: {self.state.opening}\n"))
+        # Blank line between the instructions and the rest
+        name, text = sections[-1]
+        sections[-1] = (name, text + "\n")
+        sections.extend(self.history_sections(user_action))
+        # Current action
+        sections.append(("action", f"\nCURRENT ACTION: {user_action}\n\n"))
+        if self.prompt_variant == "compact":
+            sections.append(("closing", "NARRATE:\n"))
+        else:
+            sections.append(("closing", "NARRATE IMMEDIATE CONSEQUENCES (2-4 sentences, consequence-first):\n"))
+        self.last_prompt_sections = sections
+        return "".join(text for _, text in sections)
+    
+    def generate_response(self, user_action: str, use_cache: bool = True,
+                          on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Build the prompt, route it to a model tier and generate the world response"""
+        prompt = self.build_prompt(user_action)
+        tier, model = self.router.route(self.state, self.last_analysis, prompt)
+        action_type = self.last_analysis["type"]
+        options = self.tuner.options_for(model, action_type, prompt)
+        if not use_cache:
+            # Fresh randomness: a fixed seed would reproduce the same response
+            options["seed"] = int.from_bytes(os.urandom(4), "little")
+        start = time.perf_counter()
+        tier, model, response, stats = self.generate_within_deadline(tier, model, options, action_type, prompt,
+                                                                     use_cache, on_token)
+        self.last_stats = stats
+        self.last_prompt_model = model
+        if stats.get("cached"):
+            return response
+        self.record_prompt_usage(model, stats)
+        self.router.record(tier, time.perf_counter() - start)
+        if stats.get("time_to_first_token") is not None:
+            metrics.record_time("generation.time_to_first_token", stats["time_to_first_token"])
+        record = self.tuner.observe(model, action_type, prompt, stats, response)
+        if CONFIG["SHOW_GENERATION_STATS"]:
+            console.print(
+                f"[dim]🔢 {record['decoded']} tokens decoded, {record['discarded']} discarded "
+                f"(num_predict={record['num_predict']}, num_ctx={record['num_ctx']})[/dim]"
+            )
+        return response
+    
+    def generate_within_deadline(self, tier: str, model: str, options: Dict[str, Any], action_type: str,
+                                 prompt: str, use_cache: bool = True,
+                                 on_token: Optional[Callable[[str], None]] = None,
+                                 **generate_args: Any) -> Tuple[str, str, str, Dict[str, Any]]:
+        """
+        Generate a turn within CONFIG["TURN_DEADLINE"] (no limit when it is 0 or None)
+        Returns (tier, model, response, stats) for the tier that answered; see deadline_fallback
+        """
+        stats: Dict[str, Any] = {}
+        budget = CONFIG["TURN_DEADLINE"]
+        if not budget:
+            response = OllamaAPI.generate(model, prompt, options=options, stats=stats, use_cache=use_cache,
+                                          on_token=on_token, session_id=self.session_id, **generate_args)
+            return tier, model, response, stats
+        start = time.perf_counter()
+        deadline = start + budget
+        expected = metrics.get_timing(f"tier.{tier}.latency")
+        if expected["count"] >= CONFIG["ADAPTIVE_MIN_SAMPLES"] and expected["avg"] > budget:
+            # This tier usually takes longer than the budget: start smaller right away
+            tier, model, options = self.deadline_fallback(tier, model, options, action_type, prompt,
+                                                          budget / expected["avg"])
+            metrics.increment("deadline.preemptive_fallbacks")
+        try:
+            response = OllamaAPI.generate(model, prompt, options=options, stats=stats, use_cache=use_cache,
+                                          on_token=on_token, session_id=self.session_id, deadline=deadline,
+                                          first_token_deadline=start + budget * CONFIG["DEADLINE_FIRST_TOKEN_SHARE"],
+                                          **generate_args)
+        except DeadlineExceeded:
+            # Nothing arrived in time: retry smaller with what is left of the budget
+            if time.perf_counter() >= deadline:
+                raise
+            tier, model, options = self.deadline_fallback(tier, model, options, action_type, prompt, 0.5)
+            metrics.increment("deadline.retries")
+            stats = {}
+            response = OllamaAPI.generate(model, prompt, options=options, stats=stats, use_cache=use_cache,
+                                          on_token=on_token, session_id=self.session_id, deadline=deadline,
+                                          **generate_args)
+        if stats.get("deadline_hit") and not self.quiet:
+            console.print("[dim]⏱ Turn deadline reached - showing the response so far[/dim]")
+        return tier, model, response, stats
+    
+    def deadline_fallback(self, tier: str, model: str, options: Dict[str, Any], action_type: str,
+                          prompt: str, scale: float) -> Tuple[str, str, Dict[str, Any]]:
+        """A cheaper (tier, model, options) for a turn that would miss its deadline"""
+        fast_model = self.state.fast_model or CONFIG["FAST_MODEL"]
+        if tier == "full" and fast_model and fast_model != model:
+            fast_options = {**self.tuner.options_for(fast_model, action_type, prompt),
+                            **{key: options[key] for key in ("seed", "stop") if key in options}}
+            return "fast", fast_model, fast_options
+        num_predict = options.get("num_predict", GENERATION_OPTIONS["num_predict"])
+        return tier, model, {**options, "num_predict": max(CONFIG["NUM_PREDICT_MIN"], int(num_predict * scale))}
+    
+    def estimate_tokens(self, model: Optional[str], text: str) -> int:
+        """Estimated token count, using the model's observed characters per token"""
+        return int(round(len(text) / self.tuner.chars_per_token.get(model, CHARS_PER_TOKEN)))
+    
+    def record_prompt_usage(self, model: str, stats: Dict[str, Any]):
+        """Add the last prompt's per-section sizes to the adventure totals"""
+        usage = self.state.prompt_usage
+        sections = usage.setdefault("sections", {})
+        for name, text in self.last_prompt_sections:
+            entry = sections.setdefault(name, {"chars": 0, "tokens": 0, "turns": 0})
+            entry["chars"] += len(text)
+            entry["tokens"] += self.estimate_tokens(model, text)
+            entry["turns"] += 1
+        usage["turns"] = usage.get("turns", 0) + 1
+        usage["evaluated_tokens"] = usage.get("evaluated_tokens", 0) + stats.get("prompt_eval_count", 0)
+    
+    def get_memory(self) -> Optional[SemanticMemory]:
+        """Semantic memory for this session; turns missing from the index are back-filled once"""
+        if not CONFIG["SEMANTIC_MEMORY"] or np is None or not self.state:
+            return None
+        if self.memory is None:
+            if self.memory_source is not None:
+                self.memory = SemanticMemory.load(self.memory_source, self.session_id)
+                self.memory_source = None
+            if self.memory is None:
+                self.memory = SemanticMemory(session_id=self.session_id)
+            self.memory_synced = False
+        if not self.memory_synced:
+            indexed = set(self.memory.message_indices)
+            for start, _, player_text, world_text in AdventureExporter.iter_turns(self.state.history, complete_only=True):
+                if start not in indexed:
+                    self.memory.add_turn(start, player_text, world_text)
+            self.memory_synced = True
+        return self.memory
+    
+    def complete_turn(self, user_action: str, response: str):
+        """Record the world response, index the turn and update the structured world state"""
+        self.state.add_message("assistant", response)
+        memory = self.get_memory()
+        if memory is not None:
+            turn_index = len(self.state.history) - 2
+            memory.forget_from(turn_index)
+            memory.add_turn(turn_index, user_action, response)
+        if not CONFIG["USE_WORLD_STATE"]:
+            return
+        analysis = self.analyzer.analyze_action(user_action, self.state.genre, self.state.role)
+        with self.world_lock:
+            self.world_before_turn = WorldState.from_dict(asdict(self.state.world))
+            self.state.world.update(analysis, user_action, response)
+        if CONFIG["WORLD_STATE_MODEL_PASS"]:
+            self.start_world_model_pass(user_action, response)
+    
+    def start_world_model_pass(self, user_action: str, response: str):
+        """Refine the world state with a low-priority background model call (skipped if one is running)"""
+        if self.world_pass and self.world_pass.is_alive():
+            return
+        state = self.state
+        world = state.world
+        with self.world_lock:
+            turn = world.turn
+            current = json.dumps(asdict(world))
+        world_lock = self.world_lock
+        prompt = (
+            f"{WORLD_STATE_PROMPT.strip()}\n\nCURRENT STATE:\n{current}\n\n"
+            f"PLAYER ACTION: {user_action}\nRESULT: {response}\n"
+        )
+        model = state.fast_model or CONFIG["FAST_MODEL"] or state.model
+        session_id = self.session_id
+        def run():
+            try:
+                update = OllamaAPI.generate_json(model, prompt, session_id=session_id)
+            except RuntimeError:
+                metrics.increment("world_state.model_pass_failures")
+                return
+            # Only apply if no newer turn updated (or /redo replaced) the world state meanwhile
+            with world_lock:
+                if state.world is not world or world.turn != turn:
+                    metrics.increment("world_state.model_passes_stale")
+                    return
+                world.merge(update)
+            metrics.increment("world_state.model_passes")
+        self.world_pass = threading.Thread(target=run, daemon=True)
+        self.world_pass.start()
     
     def handle_command(self, command: str) -> bool:
         """Handle special commands, returns True if should continue"""
@@ -868,12 +3362,22 @@ class GameManager:
             self.show_history()
         elif cmd == "/stats":
             self.show_stats()
+        elif cmd == "/metrics":
+            self.show_metrics()
+        elif cmd == "/world":
+            self.show_world()
+        elif cmd == "/prompt" or cmd.startswith("/prompt "):
+            self.show_prompt(show_text=cmd.endswith(" text"))
         elif cmd == "/save":
             self.save_game()
         elif cmd == "/load":
             self.load_game()
         elif cmd == "/export_txt":
             self.export_adventure()
+        elif cmd == "/export" or cmd.startswith("/export "):
+            fmt = cmd.split(maxsplit=1)[1].strip() if " " in cmd else self.ui.choose_option(
+                "Export Format", list(self.exporter.FORMATS))
+            self.export_adventure(fmt)
         elif cmd == "/redo":
             return self.redo_last_action()
         else:
@@ -915,16 +3419,30 @@ class GameManager:
         if removed_count == 0:
             console.print("[yellow]No previous response to redo[/yellow]")
             return True
+        if self.world_before_turn is not None:
+            with self.world_lock:
+                self.state.world = self.world_before_turn
+            self.world_before_turn = None
         console.print("[cyan]Generating new narrative consequences...[/cyan]")
         # Generate new response with fresh randomness
+        if CONFIG["STREAM_RESPONSES"]:
+            console.print("\n[bold magenta]🔄 NEW CONSEQUENCES 🔄[/bold magenta]")
+            with self.ui.stream_world_response("The world reacts differently to your action...", self.stream_steps) as renderer:
+                response = self.generate_response(last_player_action, use_cache=False, on_token=renderer.feed)
+                renderer.finish(self.format_response(response))
+            self.complete_turn(last_player_action, response)
+            self.start_suggestions(last_player_action, response)
+            events.publish("redo", self, state=self.state.snapshot(), action=last_player_action, response=response)
+            return True
         with console.status("[bold cyan]The world reacts differently to your action...[/bold cyan]", spinner="dots"):
-            prompt = self.build_prompt(last_player_action)
-            response = OllamaAPI.generate(self.state.model, prompt)
+            response = self.generate_response(last_player_action, use_cache=False)
         # Add the new response to history
-        self.state.add_message("assistant", response)
+        self.complete_turn(last_player_action, response)
         # Show the new response with special redo indicator
         console.print("\n[bold magenta]🔄 NEW CONSEQUENCES 🔄[/bold magenta]")
-        self.ui.show_world_response(response)
+        self.ui.show_world_response(self.format_response(response))
+        self.start_suggestions(last_player_action, response)
+        events.publish("redo", self, state=self.state.snapshot(), action=last_player_action, response=response)
         return True
     
     def show_history(self):
@@ -952,17 +3470,16 @@ class GameManager:
             console.print("[yellow]No game in progress[/yellow]")
             return
         action_count = self.state.get_message_count() // 2
-        unique_verbs = set()
-        unique_objects = set()
-        # Analyze history for action diversity
-        for msg in self.state.history:
-            if msg["role"] == "user":
-                analysis = self.analyzer.analyze_action(msg["content"], self.state.genre, self.state.role)
-                unique_verbs.update(analysis["verbs"])
-                unique_objects.update(analysis["objects"])
+        # Action diversity is counted by the event handlers as turns complete; catch up
+        # on turns they did not see (sessions rehydrated or resumed without events)
+        events.flush(self.session_id, timeout=CONFIG["REQUEST_TIMEOUT"])
+        self.count_turn_stats(self.state)
+        unique_verbs = self.turn_stats["verbs"]
+        unique_objects = self.turn_stats["objects"]
         stats_panel = Panel(
             f"[bold]Session Duration:[/bold] {self.state.get_session_duration()}\n"
             f"[bold]Model:[/bold] {self.state.model}\n"
+            f"[bold]Fast Model:[/bold] {self.state.fast_model or 'none'}\n"
             f"[bold]Total Actions:[/bold] {action_count}\n"
             f"[bold]Unique Verbs Used:[/bold] {len(unique_verbs) or '0'}\n"
             f"[bold]Unique Objects Interacted:[/bold] {len(unique_objects) or '0'}\n"
@@ -972,38 +3489,126 @@ class GameManager:
             border_style="yellow"
         )
         console.print(stats_panel)
+        tiers = self.router.tier_summary()
+        tier_table = Table(title="Model Tiers", show_header=True)
+        tier_table.add_column("Tier", style="cyan", no_wrap=True)
+        tier_table.add_column("Turns", style="white")
+        tier_table.add_column("Avg Latency", style="white")
+        tier_table.add_column("Max Latency", style="white")
+        for tier in self.router.TIERS:
+            timing = tiers[tier]
+            tier_table.add_row(tier, str(timing["count"]), f"{timing['avg']:.2f}s", f"{timing['max']:.2f}s")
+        console.print(tier_table)
+        if tiers["estimated_seconds_saved"]:
+            console.print(f"[dim]⚡ Fast tier saved ~{tiers['estimated_seconds_saved']:.1f}s this session[/dim]")
+    
+    def show_world(self):
+        """Show the structured world state carried in the prompt"""
+        if not self.state:
+            console.print("[yellow]No game in progress[/yellow]")
+            return
+        if self.state.world.is_empty():
+            console.print("[yellow]Nothing tracked yet[/yellow]")
+            return
+        console.print(Panel(self.state.world.to_prompt().strip(), title="World State", border_style="blue"))
+    
+    def show_prompt(self, show_text: bool = False):
+        """Show the last prompt by section, next to the adventure's prompt totals"""
+        if not self.state or not self.last_prompt_sections:
+            console.print("[yellow]No prompt sent yet[/yellow]")
+            return
+        model = self.last_prompt_model
+        totals = self.state.prompt_usage.get("sections", {})
+        all_tokens = sum(entry["tokens"] for entry in totals.values())
+        prompt_chars = sum(len(text) for _, text in self.last_prompt_sections)
+        prompt_table = Table(title="Last Prompt", show_header=True, header_style="bold magenta")
+        prompt_table.add_column("Section", style="cyan", no_wrap=True)
+        prompt_table.add_column("Chars", justify="right")
+        prompt_table.add_column("Est. Tokens", justify="right")
+        prompt_table.add_column("Share", justify="right")
+        prompt_table.add_column("Adventure Tokens", justify="right")
+        prompt_table.add_column("Adventure Share", justify="right")
+        for name, text in self.last_prompt_sections:
+            total = totals.get(name, {}).get("tokens", 0)
+            prompt_table.add_row(
+                name,
+                str(len(text)),
+                str(self.estimate_tokens(model, text)),
+                f"{len(text) / prompt_chars:.0%}",
+                str(total),
+                f"{total / all_tokens:.0%}" if all_tokens else "-"
+            )
+        prompt_table.add_row(
+            "[bold]total[/bold]",
+            str(prompt_chars),
+            str(self.estimate_tokens(model, "x" * prompt_chars)),
+            "100%",
+            str(all_tokens),
+            "100%" if all_tokens else "-"
+        )
+        console.print(prompt_table)
+        # Ollama reuses a cached prompt prefix, so the evaluated count can be below the estimate
+        evaluated = "cached response" if self.last_stats.get("cached") else str(self.last_stats.get("prompt_eval_count", "n/a"))
+        console.print(f"[dim]prompt_eval_count reported by {model}: {evaluated} | "
+                      f"adventure: {self.state.prompt_usage.get('evaluated_tokens', 0)} tokens over "
+                      f"{self.state.prompt_usage.get('turns', 0)} turns[/dim]")
+        if show_text:
+            for name, text in self.last_prompt_sections:
+                console.print(Panel(Text(text.strip()), title=name, border_style="dim"))
+        else:
+            console.print("[dim]Use /prompt text to see the prompt itself[/dim]")
+    
+    def show_metrics(self):
+        """Show raw counters and timings collected this session"""
+        snapshot = metrics.snapshot()
+        if not snapshot["counters"] and not snapshot["timings"]:
+            console.print("[yellow]No metrics recorded yet[/yellow]")
+            return
+        metrics_table = Table(title="Metrics", show_header=True)
+        metrics_table.add_column("Name", style="cyan", no_wrap=True)
+        metrics_table.add_column("Value", style="white")
+        for name, value in sorted(snapshot["counters"].items()):
+            metrics_table.add_row(name, str(value))
+        for name, value in sorted(snapshot["gauges"].items()):
+            metrics_table.add_row(name, str(value))
+        for name, timing in sorted(snapshot["timings"].items()):
+            metrics_table.add_row(name, f"n={timing['count']} avg={timing['avg']:.3f}s max={timing['max']:.3f}s")
+        console.print(metrics_table)
     
     def save_game(self):
-        """Save game state to JSON file"""
+        """Save game state (compressed .dgsave or JSON, see CONFIG["SAVE_FORMAT"])"""
         if not self.state:
             console.print("[yellow]No game to save[/yellow]")
             return
         AdventureExporter.ensure_directories()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_name = "".join(c for c in self.state.player_name if c.isalnum() or c in (' ', '-', '_'))
-        default_filename = f"{safe_name}_{timestamp}.json"
+        extension = f'.{CONFIG["SAVE_FORMAT"]}'
+        default_filename = f"{safe_name}_{timestamp}{extension}"
         filename = Prompt.ask(
             "[cyan]Save filename[/cyan]",
             default=default_filename
         )
-        if not filename.endswith('.json'):
-            filename += '.json'
+        if not filename.endswith(SaveStore.EXTENSIONS):
+            filename += extension
         filepath = Path(CONFIG["SAVE_DIR"]) / filename
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.state.to_dict(), f, indent=2, ensure_ascii=False)
+            SaveStore.write(self.state, filepath)
+            if self.memory is not None:
+                self.memory.save(filepath)
             self.ui.show_success(f"Game saved to {filepath}")
+            events.publish("save", self, state=self.state.snapshot(), path=filepath)
         except Exception as e:
             self.ui.show_error(f"Error saving game: {e}")
     
     def load_game(self):
-        """Load game state from JSON file"""
+        """Load game state from a save file"""
         AdventureExporter.ensure_directories()
         # List available saves
         save_dir = Path(CONFIG["SAVE_DIR"])
         saves = []
         if save_dir.exists():
-            saves = [f.name for f in save_dir.glob("*.json")]
+            saves = sorted(f.name for f in save_dir.iterdir() if f.suffix in SaveStore.EXTENSIONS)
         if not saves:
             console.print("[yellow]No saved games found[/yellow]")
             return
@@ -1028,20 +3633,11 @@ class GameManager:
             filename = Prompt.ask("[cyan]Enter filename[/cyan]")
         filepath = Path(CONFIG["SAVE_DIR"]) / filename
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # Validate loaded data
-            required = ["model", "player_name", "genre", "role", "history"]
-            if not all(k in data for k in required):
-                raise ValueError("Invalid save file format")
-            self.state = GameState(
-                model=data["model"],
-                player_name=data["player_name"],
-                genre=data["genre"],
-                role=data["role"],
-                history=data["history"],
-                start_time=datetime.fromisoformat(data["start_time"]) if data.get("start_time") else None
-            )
+            self.state = SaveStore.read(filepath)
+            self.memory = SemanticMemory.load(filepath, self.session_id) if CONFIG["SEMANTIC_MEMORY"] else None
+            self.memory_synced = False
+            self.reset_turn_state()
+            events.publish("load", self, state=self.state.snapshot(), source=self.state, path=filepath)
             self.ui.show_success(f"Game loaded from {filepath}")
             self.ui.show_game_info(self.state)
         except FileNotFoundError:
@@ -1049,23 +3645,32 @@ class GameManager:
         except Exception as e:
             self.ui.show_error(f"Error loading game: {e}")
     
-    def export_adventure(self):
-        """Export adventure to text format"""
+    def export_adventure(self, fmt: str = "txt"):
+        """Export adventure (txt, md, html or jsonl), appending to this session's previous export"""
         if not self.state:
             console.print("[yellow]No game to export[/yellow]")
             return
-        # Get filename base
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_name = "".join(c for c in self.state.player_name if c.isalnum() or c in (' ', '-', '_'))
-        default_base = f"{safe_name}_{self.state.genre}_{timestamp}"
-        base_filename = Prompt.ask(
-            "[cyan]Filename[/cyan]",
-            default=default_base
-        )
-        if not base_filename.endswith('.txt'):
-            base_filename += '.txt'
+        if fmt not in self.exporter.FORMATS:
+            self.ui.show_error(f"Unknown export format '{fmt}'. Choose from: {', '.join(self.exporter.FORMATS)}")
+            return
+        base_filename = None
+        previous = self.exporter.previous_export(self.state, fmt)
+        fresh = bool(previous) and not Confirm.ask(f"[cyan]Append new turns to {previous}?[/cyan]", default=True)
+        if not previous or fresh:
+            # Get filename base
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_name = "".join(c for c in self.state.player_name if c.isalnum() or c in (' ', '-', '_'))
+            default_base = f"{safe_name}_{self.state.genre}_{timestamp}"
+            base_filename = Prompt.ask(
+                "[cyan]Filename[/cyan]",
+                default=default_base
+            )
+            if not base_filename.endswith(f'.{fmt}'):
+                base_filename += f'.{fmt}'
         try:
-            txt_file = self.exporter.export_to_txt(self.state, base_filename)
+            start = time.perf_counter()
+            txt_file = self.exporter.export(self.state, fmt, base_filename, fresh=fresh)
+            metrics.record_time(f"export.{fmt}", time.perf_counter() - start)
             console.print(f"[green]✅ Adventure exported to: {txt_file}[/green]")
             # Offer to open the file
             if Confirm.ask("[cyan]Open exported file?[/cyan]", default=False):
@@ -1085,15 +3690,118 @@ class GameManager:
         except Exception as e:
             self.ui.show_error(f"Export failed: {e}")
     
+    def play_action(self, action: str, **message_fields: Any):
+        """Run one turn: record the action, generate and show the response, autosave"""
+        # Add to history BEFORE generating response (so redo works correctly)
+        self.state.add_message("user", action, **message_fields)
+        # Generate response based STRICTLY on player's action
+        try:
+            if CONFIG["STREAM_RESPONSES"]:
+                with self.ui.stream_world_response("The world reacts to your specific action...", self.stream_steps) as renderer:
+                    response = self.generate_response(action, on_token=renderer.feed)
+                    renderer.finish(self.format_response(response))
+            else:
+                with console.status("[bold cyan]The world reacts to your specific action...[/bold cyan]", spinner="dots"):
+                    response = self.generate_response(action)
+        except BaseException:
+            # Error or Ctrl+C: drop the unanswered action so it is neither saved nor sent again
+            self.state.history.pop()
+            raise
+        # Add response to history and display
+        self.complete_turn(action, response)
+        if not CONFIG["STREAM_RESPONSES"]:
+            self.ui.show_world_response(self.format_response(response))
+        self.start_suggestions(action, response)
+        # Autosave, stats and other hooks run off the critical path
+        events.publish("turn_completed", self, state=self.state.snapshot(), source=self.state,
+                       action=action, response=response, action_count=self.state.get_message_count() // 2)
+    
+    @staticmethod
+    def autosave_turn(event: TurnEvent):
+        """turn_completed handler: autosave every CONFIG["AUTOSAVE_EVERY"] actions (0 or less: off)"""
+        game = event.game
+        state = event.data["state"]
+        action_count = event.data["action_count"]
+        every = CONFIG["AUTOSAVE_EVERY"] or 0
+        if every <= 0 or action_count % every:
+            return
+        AdventureExporter.ensure_directories()
+        autosave_path = Path(CONFIG["SAVE_DIR"]) / f'autosave_{state.player_name}.{CONFIG["SAVE_FORMAT"]}'
+        SaveStore.write(state, autosave_path)
+        if game.memory is not None:
+            # Only turns the save holds and that are embedded already; not waiting keeps the
+            # event queue moving, and turns still in flight are back-filled on load
+            game.memory.save(autosave_path, before_index=len(state.history))
+        game.notify(f"[dim]💾 Auto-saved (Action {action_count})[/dim]")
+    
+    @staticmethod
+    def update_turn_stats(event: TurnEvent):
+        """turn_completed and load handler: count the verbs and objects of new player actions"""
+        event.game.count_turn_stats(event.data["state"], event.data["source"])
+    
+    def count_turn_stats(self, state: GameState, source: Optional[GameState] = None):
+        """
+        Bring turn_stats up to date with state's history
+        source is the live state that state was copied from; the counts start
+        over when it differs from the one they were made for (a new, loaded or
+        rehydrated game) or when its history got shorter
+        """
+        source = source or state
+        stats = self.turn_stats
+        if stats["source"] is not source or stats["messages"] > len(state.history):
+            stats = {"source": source, "messages": 0, "verbs": set(), "objects": set()}
+        for msg in state.history[stats["messages"]:]:
+            if msg["role"] == "user":
+                analysis = self.analyzer.analyze_action(msg["content"], state.genre, state.role)
+                stats["verbs"].update(analysis["verbs"])
+                stats["objects"].update(analysis["objects"])
+        stats["messages"] = len(state.history)
+        self.turn_stats = stats
+    
+    def notify(self, message: str):
+        """Show a notice from background work: above a redrawn prompt, or before the next one"""
+        if self.quiet:
+            return
+        with self.notice_lock:
+            if self.prompt_label is None:
+                self.notices.append(message)
+                return
+            console.print()
+            console.print(message)
+            console.print(self.prompt_label, end=Prompt.prompt_suffix)
+    
+    def ask_action(self, label: str) -> str:
+        """Prompt for input; pending notices are shown first"""
+        with self.notice_lock:
+            for message in self.notices:
+                console.print(message)
+            self.notices.clear()
+            self.prompt_label = label
+        try:
+            return Prompt.ask(label).strip()
+        finally:
+            with self.notice_lock:
+                self.prompt_label = None
+    
+    def start_suggestions(self, action: str, response: str):
+        """Suggest next actions in the background, on the prompt prefix of the turn just shown"""
+        if not self.suggest_actions or not self.last_prompt_model:
+            return
+        prefix = "".join(text for name, text in self.last_prompt_sections if name not in ("action", "closing"))
+        num_ctx = self.last_stats.get("options", {}).get("num_ctx", GENERATION_OPTIONS["num_ctx"])
+        self.suggester.start(self.last_prompt_model, prefix, action, response, num_ctx)
+    
+    def format_response(self, response: str) -> str:
+        """Markdown shown for a world response"""
+        return response
+    
     def game_loop(self):
         """Main game loop - where story is shaped by player actions"""
         if not self.state:
             raise ValueError("Game not initialized")
         # Show opening scene
-        opener = ROLE_STARTERS.get(self.state.genre, {}).get(self.state.role,
-            "The atmosphere hangs with possibility when")
         console.print(Panel(
-            f"[italic]{opener}...[/italic]",
+            Text(self.state.opening_scene(), style="italic"),
             title="The Adventure Begins",
             border_style="cyan"
         ))
@@ -1102,9 +3810,9 @@ class GameManager:
         while True:
             try:
                 # Get player action
-                action = Prompt.ask(
-                    f"[bold cyan]Action »[/bold cyan] "
-                ).strip()
+                action = self.ask_action("[bold cyan]Action »[/bold cyan] ")
+                # Pending suggestions must not compete with the turn
+                self.suggester.cancel()
                 if not action:
                     continue
                 # Check for commands
@@ -1112,31 +3820,17 @@ class GameManager:
                     if not self.handle_command(action):
                         break
                     continue
+                # A number picks one of the suggested actions
+                suggestion = self.suggester.pick(action)
+                if suggestion:
+                    console.print(f"[dim]→ {escape(suggestion)}[/dim]")
+                    action = suggestion
                 # Validate action (not too short)
                 if len(action.split()) < 2:
                     console.print("[yellow]⚠️ Please be more specific with your action![/yellow]")
                     console.print("[dim]Example: 'I draw my sword and attack the orc' instead of 'attack'[/dim]")
                     continue
-                # Add to history BEFORE generating response (so redo works correctly)
-                self.state.add_message("user", action)
-                # Generate response based STRICTLY on player's action
-                with console.status("[bold cyan]The world reacts to your specific action...[/bold cyan]", spinner="dots"):
-                    prompt = self.build_prompt(action)
-                    response = OllamaAPI.generate(self.state.model, prompt)
-                # Add response to history and display
-                self.state.add_message("assistant", response)
-                self.ui.show_world_response(response)
-                # Auto-save every 5 actions
-                action_count = self.state.get_message_count() // 2
-                if action_count % 5 == 0:
-                    try:
-                        AdventureExporter.ensure_directories()
-                        autosave_path = Path(CONFIG["SAVE_DIR"]) / f"autosave_{self.state.player_name}.json"
-                        with open(autosave_path, 'w', encoding='utf-8') as f:
-                            json.dump(self.state.to_dict(), f, indent=2, ensure_ascii=False)
-                        console.print(f"[dim]💾 Auto-saved (Action {action_count})[/dim]")
-                    except:
-                        pass  # Don't crash on autosave failure
+                self.play_action(action)
             except KeyboardInterrupt:
                 if Confirm.ask("\n[yellow]Really quit?[/yellow]"):
                     # Offer to save before quitting
@@ -1165,17 +3859,1500 @@ class GameManager:
         except Exception as e:
             self.ui.show_error(f"Unexpected error: {e}")
             console.print_exception(show_locals=False)
+        # Let a pending autosave finish
+        events.flush(self.session_id, timeout=CONFIG["REQUEST_TIMEOUT"])
         # Ask if player wants to restart
         if Confirm.ask("[cyan]Play again?[/cyan]", default=False):
             return True
         return False
 
 
+class PartyGameManager(GameManager):
+    """
+    Party mode: several players share one session. Each round collects every
+    member's action, resolves them all with one prompt and one generation, then
+    splits the response into per-player consequences
+    """
+    def __init__(self, quiet: bool = False, session_id: Optional[str] = None,
+                 prompt_variant: Optional[str] = None):
+        super().__init__(quiet, session_id, prompt_variant)
+        # Responses hold one line per player, so the preview must not stop at a newline
+        self.stream_steps = []
+        # A round waits for every player, so there is no single prompt to suggest for
+        self.suggest_actions = False
+        self.last_consequences: Dict[str, str] = {}
+        self.last_scene = ""
+    
+    def reset_turn_state(self):
+        super().reset_turn_state()
+        self.last_consequences = {}
+        self.last_scene = ""
+    
+    @property
+    def members(self) -> List[Dict[str, str]]:
+        return self.state.party or [{"name": self.state.player_name, "role": self.state.role}]
+    
+    def setup_game(self) -> bool:
+        """Regular setup for the first player, then the rest of the party"""
+        if not super().setup_game():
+            return False
+        party = [{"name": self.state.player_name, "role": self.state.role}]
+        size = IntPrompt.ask(f"[cyan]Number of players (2-{CONFIG['PARTY_MAX_PLAYERS']})[/cyan]", default=2)
+        size = max(2, min(CONFIG["PARTY_MAX_PLAYERS"], size))
+        roles = list(ROLE_STARTERS[self.state.genre].keys()) if self.state.genre in ROLE_STARTERS else []
+        for number in range(2, size + 1):
+            taken = {member["name"].lower() for member in party}
+            name = Prompt.ask(f"[cyan]Player {number} character name[/cyan]", default=f"Adventurer {number}")
+            while name.lower() in taken:
+                name = Prompt.ask("[yellow]That name is taken - choose another[/yellow]")
+            role = self.ui.choose_option(f"Select Role for {name}", roles + ["Custom Role"])
+            if role == "Custom Role":
+                role = Prompt.ask("[cyan]Enter custom role[/cyan]", default="Adventurer")
+            party.append({"name": name, "role": role})
+        self.state.party = party
+        return True
+    
+    def load_game(self):
+        """Load a save; a single-player save becomes a party of one"""
+        super().load_game()
+        if self.state and not self.state.party:
+            self.state.party = [{"name": self.state.player_name, "role": self.state.role}]
+    
+    def build_party_prompt(self, actions: Dict[str, str]) -> str:
+        """One prompt for the whole round, built from the shared history"""
+        combined = "\n".join(f"{name}: {action}" for name, action in actions.items())
+        self.last_analysis = self.analyzer.analyze_action(combined, self.state.genre, self.state.role)
+        system_prompt = COMPACT_SYSTEM_PROMPT if self.prompt_variant == "compact" else DM_SYSTEM_PROMPT
+        party = ", ".join(f"{member['name']} ({member['role']})" for member in self.members)
+        sections: List[Tuple[str, str]] = [
+            ("instructions", f"SYSTEM INSTRUCTIONS:\n{system_prompt.strip()}\n"),
+            ("context", f"CONTEXT:\n- Genre: {self.state.genre}\n- Party: {party}\n"),
+            ("requirements", PARTY_ROUND_RULES),
+        ]
+        if len(self.state.history) <= 1:
+            sections.append(("scene_start", f"\nSCENE START: {self.state.opening_scene()}\n"))
+        name, text = sections[-1]
+        sections[-1] = (name, text + "\n")
+        sections.extend(self.history_sections(combined))
+        sections.append(("action", f"\nACTIONS THIS ROUND:\n{combined}\n\n"))
+        sections.append(("closing", "NARRATE EACH PLAYER'S CONSEQUENCES, ONE LINE PER PLAYER:\n"))
+        self.last_prompt_sections = sections
+        return "".join(text for _, text in sections)
+    
+    @staticmethod
+    def split_response(text: str, names: List[str]) -> Tuple[str, Dict[str, str]]:
+        """
+        Split a round's response into shared scene text and per-player consequences
+        Lines start with a player's name; lines without one continue the previous player
+        """
+        match = PARTY_STOP_PATTERN.search(text)
+        if match:
+            text = text[:match.start()]
+        lookup = {name.lower(): name for name in names}
+        parts: Dict[str, List[str]] = {name: [] for name in names}
+        scene: List[str] = []
+        current = None
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            line_match = PARTY_LINE_PATTERN.match(line)
+            if line_match and line_match.group(1).strip().lower() in lookup:
+                current = lookup[line_match.group(1).strip().lower()]
+                line = line_match.group(2)
+            (parts[current] if current else scene).append(line)
+        steps = [step for step in CONFIG["POSTPROCESS_STEPS"] if step != "stop_tokens"]
+        consequences = {name: ResponsePostProcessor.process(" ".join(lines), steps=steps)
+                        for name, lines in parts.items()}
+        return ResponsePostProcessor.process(" ".join(scene), steps=steps), consequences
+    
+    def generate_response(self, user_action: str, use_cache: bool = True,
+                          on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Resolve the round recorded in the last user message with a single generation"""
+        last = self.state.history[-1]
+        actions = last.get("actions") or {self.state.player_name: user_action}
+        prompt = self.build_party_prompt(actions)
+        tier, model = self.router.route(self.state, self.last_analysis, prompt)
+        options = self.tuner.options_for(model, "party", prompt)
+        options["num_predict"] = max(options.get("num_predict", 0), CONFIG["PARTY_TOKENS_PER_PLAYER"] * len(actions))
+        options["stop"] = PARTY_STOP_TOKENS
+        if not use_cache:
+            options["seed"] = int.from_bytes(os.urandom(4), "little")
+        start = time.perf_counter()
+        tier, model, raw, stats = self.generate_within_deadline(tier, model, options, "party", prompt, use_cache,
+                                                                on_token, postprocess_steps=[])
+        self.last_stats = stats
+        self.last_prompt_model = model
+        self.last_scene, self.last_consequences = self.split_response(raw, list(actions))
+        lines = [self.last_scene] if self.last_scene else []
+        lines += [f"{name}: {text}" for name, text in self.last_consequences.items() if text]
+        response = "\n".join(lines)
+        metrics.increment("party.rounds")
+        metrics.increment("party.actions_resolved", len(actions))
+        metrics.increment("party.missing_consequences", sum(1 for text in self.last_consequences.values() if not text))
+        if not stats.get("cached"):
+            self.router.record(tier, time.perf_counter() - start)
+            self.record_prompt_usage(model, stats)
+            self.tuner.observe(model, "party", prompt, stats, response)
+        return response
+    
+    def complete_turn(self, user_action: str, response: str):
+        """Record the round, keeping the per-player split on the message"""
+        super().complete_turn(user_action, response)
+        message = self.state.history[-1]
+        message["consequences"] = dict(self.last_consequences)
+        if self.last_scene:
+            message["scene"] = self.last_scene
+    
+    def format_response(self, response: str) -> str:
+        """One paragraph per player"""
+        paragraphs = [f"*{self.last_scene}*"] if self.last_scene else []
+        for name, text in self.last_consequences.items():
+            paragraphs.append(f"**{name}:** {text or '_Nothing happens yet._'}")
+        return "\n\n".join(paragraphs) or response
+    
+    def player_view(self, name: str) -> Iterator[Tuple[str, str]]:
+        """(action, consequence) of each round as one player saw it"""
+        for start, end, _, _ in AdventureExporter.iter_turns(self.state.history, complete_only=True):
+            player_msg = self.state.history[start]
+            world_msg = self.state.history[end - 1]
+            action = player_msg.get("actions", {}).get(name)
+            consequence = world_msg.get("consequences", {}).get(name, "")
+            if world_msg.get("scene"):
+                consequence = f"{world_msg['scene']} {consequence}".strip()
+            yield action or "-", consequence or "-"
+    
+    def show_player_history(self, name: str):
+        """Per-player view of the shared history"""
+        lookup = {member["name"].lower(): member["name"] for member in self.members}
+        if name.lower() not in lookup:
+            console.print(f"[yellow]No player named {name}. Party: {', '.join(lookup.values())}[/yellow]")
+            return
+        name = lookup[name.lower()]
+        rounds = list(self.player_view(name))
+        if not rounds:
+            console.print("[yellow]No history yet[/yellow]")
+            return
+        history_table = Table(title=f"{name}'s History", show_header=True)
+        history_table.add_column("Round", style="cyan", no_wrap=True)
+        history_table.add_column("Action", style="green")
+        history_table.add_column("Consequence", style="white")
+        for number, (action, consequence) in list(enumerate(rounds, 1))[-10:]:
+            history_table.add_row(str(number), action, consequence)
+        console.print(history_table)
+    
+    def handle_command(self, command: str) -> bool:
+        """Party commands (/party, /history NAME) on top of the regular ones"""
+        cmd = command.strip()
+        if cmd.lower() == "/party":
+            party_table = Table(title="Party", show_header=True)
+            party_table.add_column("Player", style="cyan")
+            party_table.add_column("Role", style="white")
+            for member in self.members:
+                party_table.add_row(member["name"], member["role"])
+            console.print(party_table)
+            return True
+        if cmd.lower().startswith("/history "):
+            self.show_player_history(cmd.split(maxsplit=1)[1].strip())
+            return True
+        return super().handle_command(command)
+    
+    def game_loop(self):
+        """Rounds: every member acts (or /pass), then the round is resolved in one generation"""
+        if not self.state:
+            raise ValueError("Game not initialized")
+        console.print(Panel(
+            Text(self.state.opening_scene(), style="italic"),
+            title="The Adventure Begins",
+            border_style="cyan"
+        ))
+        console.print("[dim]Each player enters an action per round (/pass to sit it out). "
+                      "/party lists the party, /history NAME shows one player's view.[/dim]\n")
+        while True:
+            try:
+                actions: Dict[str, str] = {}
+                console.rule(f"[bold]Round {self.state.get_message_count() // 2 + 1}[/bold]")
+                for member in self.members:
+                    while True:
+                        action = self.ask_action(f"[bold cyan]{member['name']} ({member['role']}) »[/bold cyan] ")
+                        if not action:
+                            continue
+                        if action.lower() == "/pass":
+                            break
+                        if action.startswith('/'):
+                            if not self.handle_command(action):
+                                return
+                            continue
+                        if len(action.split()) < 2:
+                            console.print("[yellow]⚠️ Please be more specific with your action![/yellow]")
+                            continue
+                        actions[member["name"]] = action
+                        break
+                if not actions:
+                    console.print("[yellow]Everyone passed - nothing happens[/yellow]")
+                    continue
+                combined = "\n".join(f"{name}: {action}" for name, action in actions.items())
+                self.play_action(combined, actions=actions)
+            except KeyboardInterrupt:
+                if Confirm.ask("\n[yellow]Really quit?[/yellow]"):
+                    if Confirm.ask("[cyan]Save game before quitting?[/cyan]", default=True):
+                        self.save_game()
+                    break
+                console.print("\n[cyan]Resuming...[/cyan]")
+            except RuntimeError as e:
+                # play_action has already dropped the unanswered round, so it can be entered again
+                self.ui.show_error(str(e))
+
+
+events.subscribe("turn_completed", GameManager.autosave_turn)
+events.subscribe("turn_completed", GameManager.update_turn_stats)
+events.subscribe("load", GameManager.update_turn_stats)
+
+
+class SessionManager:
+    """
+    Keeps game sessions resident within a memory budget
+    Least recently used idle sessions are flushed to a .dgsave and dropped; the
+    next action on an evicted session rehydrates it from disk. Per-session warm
+    state (semantic index, tuner and router statistics) is rebuilt lazily
+    """
+    MESSAGE_OVERHEAD = 240  # approximate bytes of a history entry beyond its text
+    
+    def __init__(self, budget_bytes: Optional[int] = None, idle_seconds: Optional[float] = None,
+                 session_dir: Optional[str] = None):
+        self.budget_bytes = budget_bytes if budget_bytes is not None else CONFIG["SESSION_MEMORY_BUDGET_MB"] * 1024 * 1024
+        self.idle_seconds = idle_seconds if idle_seconds is not None else CONFIG["SESSION_IDLE_SECONDS"]
+        self.session_dir = Path(session_dir or CONFIG["SESSION_DIR"])
+        self._lock = threading.Lock()
+        self._resident: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # least recently used first
+        self._session_locks: Dict[str, threading.Lock] = {}
+    
+    def path_for(self, session_id: str) -> Path:
+        """Save file of an evicted session"""
+        return self.session_dir / f"{session_id}.dgsave"
+    
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+    
+    def estimate_size(self, game: "GameManager") -> int:
+        """Approximate resident bytes of a session"""
+        history = game.state.history
+        messages = history.resident_messages() if isinstance(history, PagedHistory) else history
+        size = sum(len(message.get("content", "")) + self.MESSAGE_OVERHEAD for message in messages)
+        if isinstance(history, PagedHistory):
+            size += history.compressed_bytes()
+        if game.memory is not None:
+            size += game.memory.nbytes
+        return size
+    
+    def resident_bytes(self) -> int:
+        """Estimated bytes held by resident sessions"""
+        with self._lock:
+            return sum(entry["size"] for entry in self._resident.values())
+    
+    def _update_gauges(self):
+        with self._lock:
+            metrics.set_gauge("sessions.resident", len(self._resident))
+            metrics.set_gauge("sessions.resident_bytes", sum(entry["size"] for entry in self._resident.values()))
+    
+    def create(self, state: GameState, session_id: Optional[str] = None, **kwargs) -> str:
+        """Register a new session; returns its id"""
+        game = GameManager(quiet=True, session_id=session_id, **kwargs)
+        if not isinstance(state.history, PagedHistory):
+            state.history = PagedHistory(state.history)  # before any other thread can see it
+        game.state = state
+        with self._lock:
+            self._resident[game.session_id] = {
+                "game": game,
+                "size": self.estimate_size(game),
+                "last_used": time.monotonic(),
+                "snapshot": state.snapshot(),
+            }
+        self.enforce_budget()
+        return game.session_id
+    
+    def _rehydrate(self, session_id: str) -> Dict[str, Any]:
+        """Load an evicted session; its semantic index is only read when first needed"""
+        path = self.path_for(session_id)
+        if not path.exists():
+            raise KeyError(f"Unknown session: {session_id}")
+        start = time.perf_counter()
+        game = GameManager(quiet=True, session_id=session_id)
+        game.state = SaveStore.read(path)
+        game.memory_source = path
+        entry = {"game": game, "size": self.estimate_size(game), "last_used": time.monotonic(),
+                 "snapshot": game.state.snapshot()}
+        with self._lock:
+            self._resident[session_id] = entry
+        metrics.increment("sessions.rehydrations")
+        metrics.record_time("sessions.rehydrate", time.perf_counter() - start)
+        return entry
+    
+    @contextmanager
+    def session(self, session_id: str) -> Iterator["GameManager"]:
+        """Use a session exclusively, rehydrating it if it was evicted"""
+        with self._session_lock(session_id):
+            with self._lock:
+                entry = self._resident.get(session_id)
+                if entry is not None:
+                    self._resident.move_to_end(session_id)
+            if entry is None:
+                entry = self._rehydrate(session_id)
+            try:
+                yield entry["game"]
+            finally:
+                entry["size"] = self.estimate_size(entry["game"])
+                entry["last_used"] = time.monotonic()
+                entry["snapshot"] = entry["game"].state.snapshot()
+        self.enforce_budget()
+    
+    def snapshot(self, session_id: str) -> GameState:
+        """
+        Read-only state as of the session's last turn, for readers such as stats or
+        analytics; never waits for a turn in progress
+        """
+        with self._lock:
+            entry = self._resident.get(session_id)
+        if entry is not None:
+            return entry["snapshot"]
+        path = self.path_for(session_id)
+        if not path.exists():
+            raise KeyError(f"Unknown session: {session_id}")
+        return SaveStore.read(path)
+    
+    def play_turn(self, session_id: str, action: str) -> str:
+        """Run one player action on a session; returns the world response"""
+        with self.session(session_id) as game:
+            game.state.add_message("user", action)
+            response = game.generate_response(action)
+            game.complete_turn(action, response)
+            return response
+    
+    def _evict(self, session_id: str, entry: Dict[str, Any]):
+        """Flush a session to disk and drop it (caller holds the session lock)"""
+        start = time.perf_counter()
+        game = entry["game"]
+        if game.world_pass is not None:
+            game.world_pass.join(CONFIG["REQUEST_TIMEOUT"])
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(session_id)
+        SaveStore.write(game.state, path)
+        if game.memory is not None:
+            game.memory.wait_idle()
+            game.memory.save(path)
+        with self._lock:
+            self._resident.pop(session_id, None)
+        metrics.increment("sessions.evictions")
+        metrics.record_time("sessions.evict", time.perf_counter() - start)
+    
+    def enforce_budget(self):
+        """Evict idle sessions, then least recently used ones while over budget; busy sessions are skipped"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = list(self._resident.items())
+            total = sum(entry["size"] for _, entry in candidates)
+        for session_id, entry in candidates:
+            over_budget = total > self.budget_bytes
+            if not over_budget and now - entry["last_used"] < self.idle_seconds:
+                break
+            lock = self._session_lock(session_id)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if self._resident.get(session_id) is entry:
+                    self._evict(session_id, entry)
+                    total -= entry["size"]
+            finally:
+                lock.release()
+        self._update_gauges()
+    
+    def close(self):
+        """Flush every resident session to disk"""
+        with self._lock:
+            candidates = list(self._resident.items())
+        for session_id, entry in candidates:
+            with self._session_lock(session_id):
+                if self._resident.get(session_id) is entry:
+                    self._evict(session_id, entry)
+        self._update_gauges()
+
+
+class BatchRunner:
+    """Headless replay of action scripts or saves through build_prompt/generate"""
+    def __init__(self, models: List[str], workers: int = 4, output_dir: str = "adventure_batch",
+                 resume: bool = True, defaults: Optional[Dict[str, str]] = None):
+        self.models = models
+        self.workers = max(1, workers)
+        self.output_dir = Path(output_dir)
+        self.resume = resume
+        self.defaults = defaults or {}
+        self.checkpoint_path = self.output_dir / "checkpoint.json"
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def load_script(self, path: Path) -> Dict[str, Any]:
+        """
+        Load an action script: a .txt file with one action per line ('#' comments),
+        a JSON list of actions, a JSON script with an "actions" list, or an existing save file
+        """
+        if path.suffix == ".json":
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                data = {"actions": data}
+            if not isinstance(data, dict):
+                raise ValueError(f"{path} is neither an action script nor a save file")
+            if "actions" in data:
+                actions = list(data["actions"])
+            elif "history" in data:
+                actions = [msg["content"] for msg in data["history"] if msg["role"] == "user"]
+            else:
+                raise ValueError(f"{path} is neither an action script nor a save file")
+            if not all(isinstance(action, str) for action in actions):
+                raise ValueError(f"{path}: actions must be strings")
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                actions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+            data = {}
+        return {
+            "name": path.stem,
+            "model": data.get("model"),
+            "player_name": data.get("player_name", self.defaults.get("player_name", "Adventurer")),
+            "genre": data.get("genre", self.defaults.get("genre", "Fantasy")),
+            "role": data.get("role", self.defaults.get("role", "Knight")),
+            "actions": actions,
+        }
+    
+    def build_jobs(self, paths: List[Path]) -> List[Dict[str, Any]]:
+        """One job per (script, model)"""
+        jobs = []
+        for path in paths:
+            script = self.load_script(path)
+            models = self.models or ([script["model"]] if script["model"] else [])
+            if not models:
+                raise RuntimeError(f"No model for {path}: pass --models")
+            for model in models:
+                safe_model = "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in model)
+                jobs.append({"id": f"{script['name']}__{safe_model}", "model": model, "script": script})
+        return jobs
+    
+    def load_checkpoint(self):
+        """Read completed jobs from a previous run"""
+        if self.resume and self.checkpoint_path.exists():
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                self.completed = json.load(f).get("completed", {})
+    
+    def write_checkpoint(self):
+        """Atomically persist the list of completed jobs"""
+        with self._lock:
+            tmp_path = self.checkpoint_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"completed": self.completed}, f, indent=2)
+            os.replace(tmp_path, self.checkpoint_path)
+    
+    @staticmethod
+    def job_save_path(job: Dict[str, Any]) -> Path:
+        """Save a job's progress is kept in"""
+        return Path(CONFIG["SAVE_DIR"]) / f"{job['id']}.json"
+    
+    def resumed_turns(self, job: Dict[str, Any]) -> int:
+        """Turns of a job replayed by an earlier run (answered actions in its save)"""
+        save_path = self.job_save_path(job)
+        if not self.resume or not save_path.exists():
+            return 0
+        try:
+            with open(save_path, 'r', encoding='utf-8') as f:
+                history = json.load(f).get("history", [])
+        except (OSError, ValueError, AttributeError):
+            return 0
+        while history and history[-1]["role"] == "user":
+            history.pop()
+        return sum(1 for msg in history if msg["role"] == "user")
+    
+    def run_job(self, job: Dict[str, Any], on_turn: Callable[[], None]) -> Dict[str, Any]:
+        """Replay one script against one model; the save is rewritten after every turn"""
+        script = job["script"]
+        save_path = self.job_save_path(job)
+        game = GameManager(quiet=True)
+        game.state = GameState(
+            model=job["model"],
+            player_name=script["player_name"],
+            genre=script["genre"],
+            role=script["role"],
+            history=PagedHistory()
+        )
+        # Resume a partially replayed job from its save
+        if self.resume and save_path.exists():
+            with open(save_path, 'r', encoding='utf-8') as f:
+                game.state = GameState.from_dict(json.load(f))
+            while game.state.history and game.state.history[-1]["role"] == "user":
+                game.state.history.pop()
+        done_turns = sum(1 for msg in game.state.history if msg["role"] == "user")
+        start = time.perf_counter()
+        tokens = 0
+        for action in script["actions"][done_turns:]:
+            game.state.add_message("user", action)
+            response = game.generate_response(action)
+            tokens += game.last_stats.get("eval_count", 0)
+            game.complete_turn(action, response)
+            tmp_path = save_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(game.state.to_dict(), f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, save_path)
+            on_turn()
+        export_path = AdventureExporter.export_to_txt(game.state, f"{job['id']}.txt")
+        return {
+            "model": job["model"],
+            "turns": len(script["actions"]) - done_turns,
+            "seconds": time.perf_counter() - start,
+            "tokens": tokens,
+            "save": str(save_path),
+            "export": export_path,
+        }
+    
+    def run(self, paths: List[Path]) -> Dict[str, Any]:
+        """Run all jobs on a bounded worker pool, skipping those already checkpointed"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        AdventureExporter.ensure_directories()
+        self.load_checkpoint()
+        jobs = [job for job in self.build_jobs(paths) if job["id"] not in self.completed]
+        # Turns already in a resumed job's save are not replayed
+        total_turns = sum(max(0, len(job["script"]["actions"]) - self.resumed_turns(job)) for job in jobs)
+        failures: Dict[str, str] = {}
+        start = time.perf_counter()
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("{task.completed}/{task.total} turns"),
+            TimeElapsedColumn(),
+            console=console,
+        ) as progress:
+            task = progress.add_task(f"Replaying {len(jobs)} sessions", total=total_turns)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {
+                    pool.submit(self.run_job, job, lambda: progress.advance(task)): job
+                    for job in jobs
+                }
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failures[job["id"]] = str(e)
+                        console.print(f"[red]✗ {job['id']}: {e}[/red]")
+                        continue
+                    with self._lock:
+                        self.completed[job["id"]] = result
+                    self.write_checkpoint()
+        elapsed = time.perf_counter() - start
+        turns = sum(self.completed[job["id"]]["turns"] for job in jobs if job["id"] in self.completed)
+        tokens = sum(self.completed[job["id"]]["tokens"] for job in jobs if job["id"] in self.completed)
+        summary = {
+            "sessions": len(jobs) - len(failures),
+            "failed": failures,
+            "turns": turns,
+            "seconds": elapsed,
+            "turns_per_second": turns / elapsed if elapsed else 0.0,
+            "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+        }
+        self.show_summary(summary)
+        return summary
+    
+    def show_summary(self, summary: Dict[str, Any]):
+        """Display throughput for this run"""
+        table = Table(title="Batch Summary", show_header=False, box=None)
+        table.add_column("Metric", style="cyan", no_wrap=True)
+        table.add_column("Value", style="white")
+        table.add_row("Sessions completed", str(summary["sessions"]))
+        table.add_row("Sessions failed", str(len(summary["failed"])))
+        table.add_row("Turns generated", str(summary["turns"]))
+        table.add_row("Elapsed", f"{summary['seconds']:.1f}s")
+        table.add_row("Throughput", f"{summary['turns_per_second']:.2f} turns/s, {summary['tokens_per_second']:.1f} tokens/s")
+        table.add_row("Checkpoint", str(self.checkpoint_path))
+        console.print(table)
+
+
+class PromptABHarness(BatchRunner):
+    """Replays the same action scripts under each prompt variant and compares cost and rule adherence"""
+    def __init__(self, models: List[str], variants: List[str], workers: int = 4,
+                 output_dir: str = "adventure_ab", resume: bool = True,
+                 defaults: Optional[Dict[str, str]] = None):
+        super().__init__(models, workers, output_dir, resume, defaults)
+        self.variants = variants
+        self.report_path = self.output_dir / "report.json"
+    
+    def build_jobs(self, paths: List[Path]) -> List[Dict[str, Any]]:
+        """One job per (script, model, variant)"""
+        return [
+            {**job, "id": f"{job['id']}__{variant}", "variant": variant}
+            for job in super().build_jobs(paths)
+            for variant in self.variants
+        ]
+    
+    @staticmethod
+    def adherence(raw_response: str) -> Dict[str, Any]:
+        """Rule adherence of a raw response (before post-processing rewrote it)"""
+        text = ResponsePostProcessor.cut_stop_tokens(raw_response)[0].strip()
+        sentences = len(list(ResponsePostProcessor.sentence_ends(text))) if text else 0
+        return {
+            "sentences": sentences,
+            "over_limit": sentences > CONFIG["MAX_RESPONSE_SENTENCES"],
+            "you_see": text.lower().startswith("you see"),
+        }
+    
+    def resumed_turns(self, job: Dict[str, Any]) -> int:
+        """Variant jobs are always replayed from the start"""
+        return 0
+    
+    def run_job(self, job: Dict[str, Any], on_turn: Callable[[], None]) -> Dict[str, Any]:
+        """Replay one script with one model and prompt variant, recording every turn"""
+        script = job["script"]
+        game = GameManager(quiet=True, prompt_variant=job["variant"])
+        game.state = GameState(
+            model=job["model"],
+            player_name=script["player_name"],
+            genre=script["genre"],
+            role=script["role"],
+            history=PagedHistory()
+        )
+        start = time.perf_counter()
+        records = []
+        for action in script["actions"]:
+            game.state.add_message("user", action)
+            turn_start = time.perf_counter()
+            # Bypass the response cache: latency has to come from the model
+            response = game.generate_response(action, use_cache=False)
+            stats = game.last_stats
+            records.append({
+                "prompt_chars": sum(len(text) for _, text in game.last_prompt_sections),
+                "prompt_tokens": stats.get("prompt_eval_count", 0),
+                "prompt_eval_seconds": stats.get("prompt_eval_duration", 0) / 1e9,
+                "latency": time.perf_counter() - turn_start,
+                "time_to_first_token": stats.get("time_to_first_token"),
+                "eval_count": stats.get("eval_count", 0),
+                **self.adherence(stats.get("raw_response", "")),
+            })
+            game.complete_turn(action, response)
+            on_turn()
+        return {
+            "model": job["model"],
+            "variant": job["variant"],
+            "turns": len(records),
+            "seconds": time.perf_counter() - start,
+            "tokens": sum(record["eval_count"] for record in records),
+            "records": records,
+        }
+    
+    def run(self, paths: List[Path]) -> Dict[str, Any]:
+        """Run all jobs, then aggregate per (model, variant)"""
+        summary = super().run(paths)
+        report = self.build_report()
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.show_report(report)
+        return summary
+    
+    def build_report(self) -> Dict[str, Dict[str, Any]]:
+        """Averages over all recorded turns per 'model/variant'"""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for result in self.completed.values():
+            if result.get("variant") in self.variants:
+                groups.setdefault(f"{result['model']}/{result['variant']}", []).extend(result["records"])
+        report = {}
+        for key, records in sorted(groups.items()):
+            if not records:
+                continue
+            first_tokens = [r["time_to_first_token"] for r in records if r["time_to_first_token"] is not None]
+            report[key] = {
+                "turns": len(records),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in records) / len(records),
+                "prompt_chars": sum(r["prompt_chars"] for r in records) / len(records),
+                "prompt_eval_seconds": sum(r["prompt_eval_seconds"] for r in records) / len(records),
+                "latency": sum(r["latency"] for r in records) / len(records),
+                "time_to_first_token": sum(first_tokens) / len(first_tokens) if first_tokens else None,
+                "sentences": sum(r["sentences"] for r in records) / len(records),
+                "over_limit_rate": sum(r["over_limit"] for r in records) / len(records),
+                "you_see_rate": sum(r["you_see"] for r in records) / len(records),
+            }
+        return report
+    
+    def show_report(self, report: Dict[str, Dict[str, Any]]):
+        """Display the comparison table"""
+        table = Table(title="Prompt Variant A/B", show_header=True, header_style="bold magenta")
+        table.add_column("Model/Variant", style="cyan", no_wrap=True)
+        table.add_column("Turns", justify="right")
+        table.add_column("Prompt Tokens", justify="right")
+        table.add_column("Prompt Eval", justify="right")
+        table.add_column("Latency", justify="right")
+        table.add_column("Sentences", justify="right")
+        table.add_column(f">{CONFIG['MAX_RESPONSE_SENTENCES']} Sent.", justify="right")
+        table.add_column("'You see'", justify="right")
+        for key, row in report.items():
+            table.add_row(
+                key,
+                str(row["turns"]),
+                f"{row['prompt_tokens']:.0f}",
+                f"{row['prompt_eval_seconds'] * 1000:.0f}ms",
+                f"{row['latency']:.2f}s",
+                f"{row['sentences']:.1f}",
+                f"{row['over_limit_rate']:.0%}",
+                f"{row['you_see_rate']:.0%}"
+            )
+        console.print(table)
+        console.print(f"[dim]Report: {self.report_path}[/dim]")
+
+
+BENCHMARK_ACTIONS = [
+    "I look around carefully",
+    "I attack the nearest enemy with my weapon",
+    "I ask the stranger what happened here",
+    "I search the room for anything useful",
+    "I run toward the exit",
+]
+
+
+class BenchmarkMatrix:
+    """Runs a fixed action corpus through every genre, model and option combination"""
+    def __init__(self, models: List[str], genres: List[str], actions: List[str],
+                 option_grid: Dict[str, List[Any]], output_dir: str = "adventure_bench"):
+        self.models = models
+        self.genres = genres
+        self.actions = actions
+        self.option_grid = option_grid
+        self.output_dir = Path(output_dir)
+        self.report_path = self.output_dir / "report.json"
+    
+    def option_sets(self) -> List[Dict[str, Any]]:
+        """Every combination of the option grid ([{}] when it is empty)"""
+        names = [name for name, values in self.option_grid.items() if values]
+        combos = [[]]
+        for name in names:
+            combos = [combo + [(name, value)] for combo in combos for value in self.option_grid[name]]
+        return [dict(combo) for combo in combos]
+    
+    @staticmethod
+    def options_label(options: Dict[str, Any]) -> str:
+        return ",".join(f"{name}={value}" for name, value in options.items()) or "default"
+    
+    def run_genre(self, model: str, genre: str, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Play the corpus as the genre's first role; one record per turn"""
+        game = GameManager(quiet=True)
+        game.state = GameState(model=model, player_name="Benchmark", genre=genre,
+                               role=next(iter(ROLE_STARTERS[genre])), history=PagedHistory())
+        records = []
+        for action in self.actions:
+            game.state.add_message("user", action)
+            prompt = game.build_prompt(action)
+            stats: Dict[str, Any] = {}
+            try:
+                # Streamed (for time to first token) and uncached (timings must come from the model)
+                response = OllamaAPI.generate(model, prompt, options=options, stats=stats, use_cache=False,
+                                              on_token=lambda text: None, session_id="benchmark")
+            except RuntimeError as e:
+                game.state.history.pop()
+                records.append({"genre": genre, "error": str(e)})
+                continue
+            eval_seconds = stats["eval_duration"] / 1e9
+            steps = set(stats["postprocess"])
+            records.append({
+                "genre": genre,
+                "time_to_first_token": stats["time_to_first_token"],
+                "tokens_per_second": stats["eval_count"] / eval_seconds if eval_seconds else None,
+                "prompt_eval_seconds": stats["prompt_eval_duration"] / 1e9,
+                "prompt_tokens": stats["prompt_eval_count"],
+                "truncated": bool(steps & {"stop_tokens", "sentence_limit"}),
+                "rewritten": bool(steps & {"filler", "passive_voice", "consequence_first"}),
+            })
+            game.complete_turn(action, response)
+        return records
+    
+    @staticmethod
+    def summarize(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Averages over successful turns"""
+        ok = [r for r in records if "error" not in r]
+        def average(key: str) -> Optional[float]:
+            values = [r[key] for r in ok if r[key] is not None]
+            return sum(values) / len(values) if values else None
+        return {
+            "turns": len(ok),
+            "errors": len(records) - len(ok),
+            "tokens_per_second": average("tokens_per_second"),
+            "time_to_first_token": average("time_to_first_token"),
+            "prompt_eval_seconds": average("prompt_eval_seconds"),
+            "prompt_tokens": average("prompt_tokens"),
+            "truncate_rate": average("truncated"),
+            "rewrite_rate": average("rewritten"),
+        }
+    
+    def run(self) -> Dict[str, Any]:
+        """Run the whole matrix sequentially (parallel runs would distort the timings)"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        option_sets = self.option_sets()
+        cells = [(model, options) for model in self.models for options in option_sets]
+        report: Dict[str, Any] = {
+            "actions": self.actions,
+            "genres": self.genres,
+            "option_grid": self.option_grid,
+            "results": [],
+        }
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("{task.completed}/{task.total} genres"),
+            TimeElapsedColumn(),
+            console=console,
+        ) as progress:
+            task = progress.add_task("Benchmarking", total=len(cells) * len(self.genres))
+            for model, options in cells:
+                records = []
+                per_genre = {}
+                for genre in self.genres:
+                    progress.update(task, description=f"{model} [{self.options_label(options)}] {genre}")
+                    genre_records = self.run_genre(model, genre, options)
+                    per_genre[genre] = self.summarize(genre_records)
+                    records.extend(genre_records)
+                    progress.advance(task)
+                report["results"].append({
+                    "model": model,
+                    "options": options,
+                    **self.summarize(records),
+                    "genres": per_genre,
+                })
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.show_report(report)
+        return report
+    
+    def show_report(self, report: Dict[str, Any]):
+        """One row per (model, options)"""
+        def fmt(value: Optional[float], pattern: str) -> str:
+            return "-" if value is None else pattern.format(value)
+        table = Table(title="Model Benchmark", show_header=True, header_style="bold magenta")
+        table.add_column("Model", style="cyan", no_wrap=True)
+        table.add_column("Options", overflow="fold")
+        table.add_column("Turns", justify="right")
+        table.add_column("Tok/s", justify="right")
+        table.add_column("TTFT", justify="right")
+        table.add_column("Prompt Eval", justify="right")
+        table.add_column("Truncated", justify="right")
+        table.add_column("Rewritten", justify="right")
+        for row in sorted(report["results"], key=lambda r: -(r["tokens_per_second"] or 0)):
+            table.add_row(
+                row["model"],
+                self.options_label(row["options"]),
+                f"{row['turns']}" + (f" ([red]{row['errors']} failed[/red])" if row["errors"] else ""),
+                fmt(row["tokens_per_second"], "{:.1f}"),
+                fmt(row["time_to_first_token"], "{:.2f}s"),
+                fmt(row["prompt_eval_seconds"] and row["prompt_eval_seconds"] * 1000, "{:.0f}ms"),
+                fmt(row["truncate_rate"], "{:.0%}"),
+                fmt(row["rewrite_rate"], "{:.0%}")
+            )
+        console.print(table)
+        console.print(f"[dim]Report (with per-genre breakdown): {self.report_path}[/dim]")
+
+
+class StubOllamaServer:
+    """
+    Minimal local stand-in for the Ollama API (tags, generate, embed) so the
+    benchmark and other tools can run offline. Timings it reports are synthetic
+    """
+    MODELS = ["stub-small", "stub-large"]
+    RESPONSES = [
+        "Your blade bites into the wooden beam. Splinters scatter across the floor. The noise echoes down the hall.",
+        "Suddenly, the torch flickers and dies. Darkness swallows the corridor. Something shifts in the shadows.",
+        "A low growl can be heard from the doorway. The hinges creak. Dust drifts from the ceiling. A shape moves. It stops. Silence returns.",
+        "You can see the stranger flinch at your words. He glances at the door. His hand drifts to his belt.",
+        "The latch gives way with a sharp click. Cold air rushes in.\nPlayer: I step through",
+    ]
+    
+    def __init__(self, port: int = 0, tokens_per_second: float = 60.0):
+        stub = self
+        self.tokens_per_second = tokens_per_second
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+            def send_json(self, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def do_GET(self):
+                if self.path.rstrip("/") == "/api/tags":
+                    self.send_json({"models": [{"name": name} for name in stub.MODELS]})
+                else:
+                    self.send_error(404)
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/embed":
+                    inputs = request.get("input", [])
+                    self.send_json({"embeddings": [stub.embedding(text) for text in inputs]})
+                elif self.path == "/api/generate":
+                    stub.generate(self, request)
+                else:
+                    self.send_error(404)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+    
+    def __enter__(self) -> "StubOllamaServer":
+        self.thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+    
+    @staticmethod
+    def embedding(text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:16]]
+    
+    def generate(self, handler: Any, request: Dict[str, Any]):
+        """Deterministic response per prompt; streamed in small chunks when asked"""
+        prompt = request.get("prompt", "")
+        if request.get("format") == "json":
+            text = "{}"
+        else:
+            text = self.RESPONSES[int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % len(self.RESPONSES)]
+        eval_count = max(1, len(text) // CHARS_PER_TOKEN)
+        final = {
+            "model": request.get("model"),
+            "done": True,
+            "done_reason": "stop",
+            "eval_count": eval_count,
+            "eval_duration": int(eval_count / self.tokens_per_second * 1e9),
+            "prompt_eval_count": len(prompt) // CHARS_PER_TOKEN,
+            "prompt_eval_duration": int(len(prompt) // CHARS_PER_TOKEN * 2e5),
+        }
+        if not request.get("stream", True):
+            handler.send_json({"response": text, **final})
+            return
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.end_headers()
+        delay = 1.0 / self.tokens_per_second
+        for i in range(0, len(text), CHARS_PER_TOKEN):
+            handler.wfile.write((json.dumps({"response": text[i:i + CHARS_PER_TOKEN], "done": False}) + "\n").encode("utf-8"))
+            handler.wfile.flush()
+            time.sleep(delay)
+        handler.wfile.write((json.dumps({"response": "", **final}) + "\n").encode("utf-8"))
+
+
+class SaveAnalytics:
+    """Aggregate statistics and deduplicated prompt/response pairs over a directory of saves"""
+    HISTORY_WINDOW = 8
+    IN_FLIGHT_PER_WORKER = 4
+    CHECKPOINT_EVERY = 100
+    
+    def __init__(self, save_dir: str, output_dir: str = "adventure_analytics",
+                 workers: Optional[int] = None, resume: bool = True, extract_pairs: bool = True):
+        self.save_dir = Path(save_dir)
+        self.output_dir = Path(output_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.resume = resume
+        self.extract_pairs = extract_pairs
+        self.checkpoint_path = self.output_dir / "checkpoint.json"
+        self.pairs_path = self.output_dir / "pairs.jsonl"
+        self.report_path = self.output_dir / "report.json"
+    
+    @staticmethod
+    def analyze_save(path: str, extract_pairs: bool = True) -> Dict[str, Any]:
+        """Analyze one save (runs in a worker process)"""
+        state = SaveStore.read(Path(path))
+        game = GameManager(quiet=True)
+        # Replay from the start so each prompt is the one the model saw live: a rolling
+        # window of history (build_prompt only reads the most recent messages) and the
+        # world state as it was before that turn, not as the save left it
+        game.state = replace(state, history=[], world=WorldState())
+        analyzer = ActionAnalyzer()
+        stats: Dict[str, Any] = {
+            "sessions": 1,
+            "turns": 0,
+            "action_types": {},
+            "intensities": {},
+            "models": {state.model: 1},
+            "model_turns": {},
+            "genres": {state.genre: 1},
+            "genre_turns": {},
+            "response_chars": 0,
+            "response_words": 0,
+            "response_word_buckets": {},
+        }
+        pairs = []
+        for _, _, player_text, world_text in AdventureExporter.iter_turns(state.history):
+            analysis = analyzer.analyze_action(player_text, state.genre, state.role)
+            stats["turns"] += 1
+            stats["action_types"][analysis["type"]] = stats["action_types"].get(analysis["type"], 0) + 1
+            stats["intensities"][analysis["intensity"]] = stats["intensities"].get(analysis["intensity"], 0) + 1
+            stats["model_turns"][state.model] = stats["model_turns"].get(state.model, 0) + 1
+            stats["genre_turns"][state.genre] = stats["genre_turns"].get(state.genre, 0) + 1
+            if world_text:
+                words = len(world_text.split())
+                bucket = f"{(words // 20) * 20}-{(words // 20) * 20 + 19}"
+                stats["response_chars"] += len(world_text)
+                stats["response_words"] += words
+                stats["response_word_buckets"][bucket] = stats["response_word_buckets"].get(bucket, 0) + 1
+            # Like play_action: the action is in the history when the prompt is built
+            game.state.history.append({"role": "user", "content": player_text})
+            if world_text:
+                if extract_pairs:
+                    prompt = game.build_prompt(player_text)
+                    pair_id = hashlib.sha1(f"{prompt}\x00{world_text}".encode("utf-8")).hexdigest()
+                    pairs.append({"id": pair_id, "prompt": prompt, "response": world_text,
+                                  "model": state.model, "genre": state.genre, "role": state.role})
+                game.state.history.append({"role": "assistant", "content": world_text})
+                if CONFIG["USE_WORLD_STATE"]:
+                    game.state.world.update(analysis, player_text, world_text)
+            del game.state.history[:-SaveAnalytics.HISTORY_WINDOW]
+        return {"path": path, "stats": stats, "pairs": pairs}
+    
+    @staticmethod
+    def merge(total: Dict[str, Any], part: Dict[str, Any]):
+        """Add nested counters of part into total"""
+        for key, value in part.items():
+            if isinstance(value, dict):
+                SaveAnalytics.merge(total.setdefault(key, {}), value)
+            else:
+                total[key] = total.get(key, 0) + value
+    
+    def load_checkpoint(self) -> Tuple[set, Dict[str, Any], set]:
+        """Processed saves, aggregate so far and ids of pairs already written"""
+        if not (self.resume and self.checkpoint_path.exists()):
+            if self.pairs_path.exists():
+                self.pairs_path.unlink()
+            return set(), {}, set()
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        seen = set()
+        if self.pairs_path.exists():
+            with open(self.pairs_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        seen.add(json.loads(line)["id"])
+        return set(checkpoint["processed"]), checkpoint["aggregate"], seen
+    
+    def write_checkpoint(self, processed: set, aggregate: Dict[str, Any]):
+        """Atomically persist progress"""
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"processed": sorted(processed), "aggregate": aggregate}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+    
+    def run(self) -> Dict[str, Any]:
+        """Stream every save through a process pool with a bounded number of tasks in flight"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        processed, aggregate, seen = self.load_checkpoint()
+        paths = (str(p) for p in sorted(self.save_dir.iterdir())
+                 if p.suffix in SaveStore.EXTENSIONS and str(p) not in processed)
+        max_in_flight = self.workers * self.IN_FLIGHT_PER_WORKER
+        failures: Dict[str, str] = {}
+        duplicates = 0
+        since_checkpoint = 0
+        start = time.perf_counter()
+        with open(self.pairs_path, 'a', encoding='utf-8') as pairs_file, \
+                ProcessPoolExecutor(max_workers=self.workers) as pool, \
+                Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"),
+                         TextColumn("{task.completed} saves"), TimeElapsedColumn(), console=console) as progress:
+            task = progress.add_task("Analyzing saves", total=None)
+            in_flight: Dict[Any, str] = {}  # future -> save path
+            exhausted = False
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                    else:
+                        in_flight[pool.submit(SaveAnalytics.analyze_save, path, self.extract_pairs)] = path
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failures[path] = str(e)
+                        continue
+                    self.merge(aggregate, result["stats"])
+                    for pair in result["pairs"]:
+                        if pair["id"] in seen:
+                            duplicates += 1
+                            continue
+                        seen.add(pair["id"])
+                        pairs_file.write(json.dumps(pair, ensure_ascii=False) + "\n")
+                    processed.add(result["path"])
+                    progress.advance(task)
+                    since_checkpoint += 1
+                    if since_checkpoint >= self.CHECKPOINT_EVERY:
+                        pairs_file.flush()
+                        self.write_checkpoint(processed, aggregate)
+                        since_checkpoint = 0
+            pairs_file.flush()
+            self.write_checkpoint(processed, aggregate)
+        elapsed = time.perf_counter() - start
+        report = {
+            **aggregate,
+            "unique_pairs": len(seen),
+            "duplicate_pairs_this_run": duplicates,
+            "failed": failures,
+            "avg_response_words": aggregate.get("response_words", 0) / max(1, aggregate.get("turns", 0)),
+            "elapsed_seconds": elapsed,
+        }
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        self.show_report(report)
+        return report
+    
+    def show_report(self, report: Dict[str, Any]):
+        """Display the aggregate report"""
+        console.print(Panel(
+            f"[bold]Sessions:[/bold] {report.get('sessions', 0)}\n"
+            f"[bold]Turns:[/bold] {report.get('turns', 0)}\n"
+            f"[bold]Avg Response Words:[/bold] {report['avg_response_words']:.1f}\n"
+            f"[bold]Unique Pairs:[/bold] {report['unique_pairs']} ({report['duplicate_pairs_this_run']} duplicates skipped)\n"
+            f"[bold]Failed Saves:[/bold] {len(report['failed'])}\n"
+            f"[bold]Elapsed:[/bold] {report['elapsed_seconds']:.1f}s",
+            title="Save Corpus Report",
+            border_style="yellow"
+        ))
+        for key, title in [("action_types", "Action Types"), ("models", "Sessions per Model"),
+                           ("genre_turns", "Turns per Genre")]:
+            table = Table(title=title, show_header=False, box=None)
+            table.add_column("Name", style="cyan", no_wrap=True)
+            table.add_column("Count", style="white")
+            for name, count in sorted(report.get(key, {}).items(), key=lambda item: -item[1]):
+                table.add_row(name, str(count))
+            console.print(table)
+        console.print(f"[dim]Report: {self.report_path} | Pairs: {self.pairs_path}[/dim]")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Command line interface: interactive play by default, plus headless tools"""
+    parser = argparse.ArgumentParser(description="LLM Adventure Game powered by Ollama")
+    parser.add_argument("--url", help="Ollama URL (default: %(default)s)", default=CONFIG["OLLAMA_URL"])
+    subparsers = parser.add_subparsers(dest="command")
+    play_parser = subparsers.add_parser("play", help="Play interactively (default)")
+    play_parser.add_argument("--party", action="store_true", help="Several players share one session")
+    batch_parser = subparsers.add_parser("batch", help="Replay action scripts or saves headlessly")
+    batch_parser.add_argument("inputs", nargs="+", type=Path, help="Action scripts (.txt/.json) or save files")
+    batch_parser.add_argument("--models", nargs="+", default=[], help="Models to replay with (default: model in the save)")
+    batch_parser.add_argument("--workers", type=int, default=4, help="Concurrent sessions")
+    batch_parser.add_argument("--out", default="adventure_batch", help="Output directory for saves, exports and checkpoint")
+    batch_parser.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint")
+    batch_parser.add_argument("--seed", type=int, help="Fixed seed (enables the response cache)")
+    batch_parser.add_argument("--parallel", type=int, help="Max concurrent requests to Ollama (default: OLLAMA_NUM_PARALLEL or 4)")
+    batch_parser.add_argument("--genre", default="Fantasy", help="Genre for plain-text scripts")
+    batch_parser.add_argument("--role", default="Knight", help="Role for plain-text scripts")
+    batch_parser.add_argument("--player", default="Adventurer", help="Character name for plain-text scripts")
+    analyze_parser = subparsers.add_parser("analyze", help="Aggregate statistics and training pairs from saves")
+    analyze_parser.add_argument("saves", nargs="?", default=CONFIG["SAVE_DIR"], help="Directory of saves")
+    analyze_parser.add_argument("--out", default="adventure_analytics", help="Output directory for report, pairs and checkpoint")
+    analyze_parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    analyze_parser.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint")
+    analyze_parser.add_argument("--no-pairs", action="store_true", help="Only compute statistics")
+    ab_parser = subparsers.add_parser("ab-prompt", help="Compare prompt variants on the same action scripts")
+    ab_parser.add_argument("inputs", nargs="+", type=Path, help="Action scripts (.txt/.json) or save files")
+    ab_parser.add_argument("--models", nargs="+", default=[], help="Models to replay with (default: model in the save)")
+    ab_parser.add_argument("--variants", nargs="+", default=list(PROMPT_VARIANTS), choices=PROMPT_VARIANTS,
+                           help="Prompt variants to compare")
+    ab_parser.add_argument("--workers", type=int, default=2, help="Concurrent sessions")
+    ab_parser.add_argument("--out", default="adventure_ab", help="Output directory for report and checkpoint")
+    ab_parser.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint")
+    ab_parser.add_argument("--genre", default="Fantasy", help="Genre for plain-text scripts")
+    ab_parser.add_argument("--role", default="Knight", help="Role for plain-text scripts")
+    ab_parser.add_argument("--player", default="Adventurer", help="Character name for plain-text scripts")
+    matrix_parser = subparsers.add_parser("bench", help="Benchmark models across genres and generation options")
+    matrix_parser.add_argument("--models", nargs="+", help="Models to benchmark (default: all installed)")
+    matrix_parser.add_argument("--genres", nargs="+", choices=list(ROLE_STARTERS), metavar="GENRE",
+                               help="Genres to play (default: all)")
+    matrix_parser.add_argument("--actions", type=Path, help="Action corpus, one per line (default: built-in)")
+    matrix_parser.add_argument("--num-ctx", nargs="+", type=int, default=[], help="num_ctx values to try")
+    matrix_parser.add_argument("--num-predict", nargs="+", type=int, default=[], help="num_predict values to try")
+    matrix_parser.add_argument("--temperature", nargs="+", type=float, default=[], help="Temperatures to try")
+    matrix_parser.add_argument("--out", default="adventure_bench", help="Output directory for the report")
+    matrix_parser.add_argument("--stub", action="store_true", help="Run against a built-in stub server (offline)")
+    bench_parser = subparsers.add_parser("bench-postprocess", help="Check and time the response post-processing pipeline")
+    bench_parser.add_argument("--iterations", type=int, default=2000, help="Passes over the golden cases")
+    snapshot_parser = subparsers.add_parser("bench-snapshot", help="Check and time copy-on-write state snapshots")
+    snapshot_parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 10000, 100000],
+                                 help="History lengths (messages) to measure")
+    snapshot_parser.add_argument("--iterations", type=int, default=200, help="Snapshots (and copies) per size")
+    sessions_parser = subparsers.add_parser("bench-sessions", help="Play many sessions under a memory budget and check eviction")
+    sessions_parser.add_argument("--sessions", type=int, default=20, help="Concurrent game sessions")
+    sessions_parser.add_argument("--turns", type=int, default=5, help="Turns played in each session")
+    sessions_parser.add_argument("--budget-kb", type=int, default=32, help="Resident memory budget in KiB")
+    sessions_parser.add_argument("--workers", type=int, default=4, help="Sessions played at the same time")
+    sessions_parser.add_argument("--model", help="Model to play with (default: first installed)")
+    sessions_parser.add_argument("--out", default="adventure_sessions_bench", help="Directory for evicted sessions")
+    sessions_parser.add_argument("--stub", action="store_true", help="Run against a built-in stub server (offline)")
+    return parser
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Entry point for the batch subcommand"""
+    CONFIG["SAVE_DIR"] = str(Path(args.out) / "saves")
+    CONFIG["EXPORT_DIR"] = str(Path(args.out) / "exports")
+    if args.seed is not None:
+        CONFIG["SEED"] = args.seed
+    if args.parallel:
+        CONFIG["MAX_PARALLEL_GENERATIONS"] = max(1, args.parallel)
+    runner = BatchRunner(
+        models=args.models,
+        workers=args.workers,
+        output_dir=args.out,
+        resume=not args.no_resume,
+        defaults={"genre": args.genre, "role": args.role, "player_name": args.player}
+    )
+    summary = runner.run(args.inputs)
+    return 1 if summary["failed"] else 0
+
+
+def run_benchmark(args: argparse.Namespace) -> int:
+    """Entry point for the bench subcommand"""
+    actions = BENCHMARK_ACTIONS
+    if args.actions:
+        with open(args.actions, 'r', encoding='utf-8') as f:
+            actions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    def run() -> Optional[Dict[str, Any]]:
+        models = args.models or OllamaAPI.list_models()
+        if not models:
+            console.print("[red]✗ No models to benchmark: pass --models or start Ollama with at least one model pulled[/red]")
+            return None
+        matrix = BenchmarkMatrix(
+            models=models,
+            genres=args.genres or list(ROLE_STARTERS),
+            actions=actions,
+            option_grid={"num_ctx": args.num_ctx, "num_predict": args.num_predict, "temperature": args.temperature},
+            output_dir=args.out
+        )
+        return matrix.run()
+    if args.stub:
+        with StubOllamaServer(tokens_per_second=400) as stub:
+            CONFIG["OLLAMA_URL"] = stub.url
+            report = run()
+    else:
+        report = run()
+    if report is None:
+        return 1
+    return 1 if any(row["errors"] for row in report["results"]) else 0
+
+
+def run_postprocess_bench(args: argparse.Namespace) -> int:
+    """Entry point for the bench-postprocess subcommand: golden checks, then timings"""
+    def stream_chunks(text: str) -> Iterator[str]:
+        # Roughly token-sized chunks of varying length
+        position = 0
+        while position < len(text):
+            size = 1 + position % 5
+            yield text[position:position + size]
+            position += size
+    
+    def run_stream(text: str) -> str:
+        processor = ResponsePostProcessor.stream()
+        for chunk in stream_chunks(text):
+            processor.feed(chunk)
+        processor.finish()
+        return processor.text.strip()
+    
+    failures = []
+    for raw, expected in POSTPROCESS_GOLDEN_CASES:
+        for mode, result in (("full", ResponsePostProcessor.process(raw)), ("stream", run_stream(raw))):
+            if result != expected:
+                failures.append((mode, raw, expected, result))
+    if failures:
+        table = Table(title="Post-processing Golden Failures", show_header=True, header_style="bold red")
+        table.add_column("Mode")
+        table.add_column("Input")
+        table.add_column("Expected")
+        table.add_column("Got")
+        for mode, raw, expected, result in failures:
+            table.add_row(mode, repr(raw), repr(expected), repr(result))
+        console.print(table)
+        return 1
+    console.print(f"[green]✓ {len(POSTPROCESS_GOLDEN_CASES)} golden cases match (full and streamed)[/green]")
+    chunked = [(raw, list(stream_chunks(raw))) for raw, _ in POSTPROCESS_GOLDEN_CASES]
+    timings = {}
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for raw, _ in chunked:
+            ResponsePostProcessor.process(raw)
+    timings["full"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for _, chunks in chunked:
+            processor = ResponsePostProcessor.stream()
+            for chunk in chunks:
+                processor.feed(chunk)
+            processor.finish()
+    timings["stream"] = time.perf_counter() - start
+    responses = args.iterations * len(chunked)
+    table = Table(title="Post-processing Benchmark", show_header=True, header_style="bold magenta")
+    table.add_column("Mode", style="cyan")
+    table.add_column("Responses", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Per response", justify="right")
+    for mode, seconds in timings.items():
+        table.add_row(mode, str(responses), f"{seconds:.3f}s", f"{seconds / responses * 1e6:.1f}µs")
+    console.print(table)
+    return 0
+
+
+def run_snapshot_bench(args: argparse.Namespace) -> int:
+    """Entry point for the bench-snapshot subcommand: isolation check, then snapshot vs. to_dict() copy"""
+    def make_state(size: int) -> GameState:
+        state = GameState(model="bench", player_name="Bench", genre="Fantasy", role="Knight", history=PagedHistory())
+        for i in range(size):
+            role = "user" if i % 2 == 0 else "assistant"
+            state.add_message(role, f"Message {i}: the torch flickers as the party moves deeper into the crypt.")
+        return state
+    
+    # A snapshot must not see later appends, replacements or pops (including unsealing a block)
+    state = make_state(3 * CONFIG["SAVE_BLOCK_SIZE"] + 1)
+    expected = list(state.history)
+    view = state.snapshot()
+    for _ in range(2 * CONFIG["SAVE_BLOCK_SIZE"]):
+        state.history.pop()
+    state.history[-1] = {"role": "assistant", "content": "replaced"}
+    for _ in range(3 * CONFIG["SAVE_BLOCK_SIZE"]):
+        state.add_message("user", "later")
+    if list(view.history) != expected or len(view.history) != len(expected):
+        console.print("[red]✗ Snapshot changed after writes to the live history[/red]")
+        return 1
+    console.print("[green]✓ Snapshots are isolated from appends, replacements and pops[/green]")
+    table = Table(title="State Snapshot Benchmark", show_header=True, header_style="bold magenta")
+    table.add_column("Messages", justify="right", style="cyan")
+    table.add_column("snapshot()", justify="right")
+    table.add_column("to_dict() copy", justify="right")
+    table.add_column("Speedup", justify="right")
+    for size in args.sizes:
+        state = make_state(size)
+        state.snapshot()  # first call only marks the blocks as shared
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            state.snapshot()
+        snapshot_time = (time.perf_counter() - start) / args.iterations
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            state.to_dict()
+        copy_time = (time.perf_counter() - start) / args.iterations
+        table.add_row(str(size), f"{snapshot_time * 1e6:.1f}µs", f"{copy_time * 1e6:.1f}µs",
+                      f"{copy_time / snapshot_time:.0f}x")
+    console.print(table)
+    return 0
+
+
+def run_sessions_bench(args: argparse.Namespace) -> int:
+    """
+    Entry point for the bench-sessions subcommand: turns on many sessions through
+    SessionManager, then a check that every evicted session comes back intact
+    """
+    def run() -> int:
+        model = args.model or next(iter(OllamaAPI.list_models()), None)
+        if not model:
+            console.print("[red]✗ No model to play with: pass --model or start Ollama with at least one model pulled[/red]")
+            return 1
+        manager = SessionManager(budget_bytes=args.budget_kb * 1024, session_dir=args.out)
+        genres = list(ROLE_STARTERS)
+        played: Dict[str, List[str]] = {}
+        for number in range(max(1, args.sessions)):
+            genre = genres[number % len(genres)]
+            state = GameState(model=model, player_name=f"Player {number + 1}", genre=genre,
+                              role=next(iter(ROLE_STARTERS[genre])), history=PagedHistory())
+            played[manager.create(state)] = []
+        evictions = metrics.get_counter("sessions.evictions")
+        rehydrations = metrics.get_counter("sessions.rehydrations")
+        peak_bytes = 0
+        failed = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            for turn in range(args.turns):
+                futures = {}
+                for session_id, actions in played.items():
+                    action = BENCHMARK_ACTIONS[(turn + len(futures)) % len(BENCHMARK_ACTIONS)]
+                    futures[executor.submit(manager.play_turn, session_id, action)] = (session_id, action)
+                for future in as_completed(futures):
+                    session_id, action = futures[future]
+                    try:
+                        future.result()
+                        played[session_id].append(action)
+                    except (RuntimeError, SchedulerBusy) as e:
+                        failed += 1
+                        console.print(f"[yellow]⚠ {session_id}: {e}[/yellow]")
+                    peak_bytes = max(peak_bytes, manager.resident_bytes())
+        elapsed = time.perf_counter() - start
+        manager.close()
+        # Every session is on disk now; each must hold exactly the turns that were played
+        broken = []
+        for session_id, actions in played.items():
+            history = list(manager.snapshot(session_id).history)
+            if [message["content"] for message in history if message["role"] == "user"] != actions \
+                    or len(history) != 2 * len(actions):
+                broken.append(session_id)
+        table = Table(title="Session Eviction Benchmark", show_header=True, header_style="bold magenta")
+        table.add_column("Metric", style="cyan")
+        table.add_column("Value", justify="right")
+        table.add_row("Sessions", str(len(played)))
+        table.add_row("Turns played", f"{sum(len(actions) for actions in played.values())} ({failed} failed)")
+        table.add_row("Budget", f"{args.budget_kb} KiB")
+        table.add_row("Peak resident", f"{peak_bytes / 1024:.1f} KiB")
+        table.add_row("Evictions", str(metrics.get_counter("sessions.evictions") - evictions))
+        table.add_row("Rehydrations", str(metrics.get_counter("sessions.rehydrations") - rehydrations))
+        table.add_row("Avg evict", f"{metrics.get_timing('sessions.evict')['avg'] * 1000:.1f}ms")
+        table.add_row("Avg rehydrate", f"{metrics.get_timing('sessions.rehydrate')['avg'] * 1000:.1f}ms")
+        table.add_row("Elapsed", f"{elapsed:.1f}s")
+        console.print(table)
+        if broken:
+            console.print(f"[red]✗ {len(broken)} sessions came back from disk with the wrong history: {', '.join(broken)}[/red]")
+            return 1
+        console.print("[green]✓ Every session came back from disk with the turns it played[/green]")
+        return 1 if failed else 0
+    if args.stub:
+        with StubOllamaServer(tokens_per_second=400) as stub:
+            CONFIG["OLLAMA_URL"] = stub.url
+            return run()
+    return run()
+
+
 def main():
     """Main entry point"""
+    args = build_arg_parser().parse_args()
+    CONFIG["OLLAMA_URL"] = args.url
+    if args.command == "batch":
+        sys.exit(run_batch(args))
+    if args.command == "ab-prompt":
+        harness = PromptABHarness(
+            models=args.models,
+            variants=args.variants,
+            workers=args.workers,
+            output_dir=args.out,
+            resume=not args.no_resume,
+            defaults={"genre": args.genre, "role": args.role, "player_name": args.player}
+        )
+        summary = harness.run(args.inputs)
+        sys.exit(1 if summary["failed"] else 0)
+    if args.command == "bench":
+        sys.exit(run_benchmark(args))
+    if args.command == "bench-postprocess":
+        sys.exit(run_postprocess_bench(args))
+    if args.command == "bench-snapshot":
+        sys.exit(run_snapshot_bench(args))
+    if args.command == "bench-sessions":
+        sys.exit(run_sessions_bench(args))
+    if args.command == "analyze":
+        report = SaveAnalytics(args.saves, args.out, args.workers, not args.no_resume, not args.no_pairs).run()
+        sys.exit(1 if report["failed"] else 0)
     # Create necessary directories
     AdventureExporter.ensure_directories()
-    game = GameManager()
+    game = PartyGameManager() if getattr(args, "party", False) else GameManager()
     try:
         while True:
             if not game.run():
@@ -1186,6 +5363,8 @@ def main():
     except Exception as e:
         console.print(f"\n[bold red]Fatal error:[/bold red] {e}")
         console.print_exception(show_locals=False)
+    finally:
+        opening_pool.flush()
     console.print("\n[bold green]Thanks for playing![/bold green]")
 
 